@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from run_benchmarks import git_commit
+
+# Measures startup time of command line tools: import of common.classeslib and of heavy modules,
+# and wall time of seisextractor.py until it reports wrong parameters. Every run is a fresh interpreter.
+#
+# usage: python import_time.py [--repeat 5] [--output import_results.json]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTS = ['common.classeslib', 'numpy', 'pandas', 'segyio', 'scipy.interpolate']
+
+def run_python(args, cwd=ROOT):
+# wall time of python run with given arguments, in a new process
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=cwd, capture_output=True)
+    return time.perf_counter() - start
+
+def best_of(repeat, func, *args):
+    return min(func(*args) for _ in range(repeat))
+
+def import_time(module):
+# import time of module measured inside interpreter, without interpreter startup
+    code = f'import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)'
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return float(output) if output else float('nan')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Startup time of SeisExtractor command line tools')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of every measurement, the best one is reported')
+    parser.add_argument('--output', default='import_results.json', help='JSON file for results')
+    args = parser.parse_args()
+
+    results = []
+    for module in IMPORTS:
+        seconds = best_of(args.repeat, import_time, module)
+        results.append(dict(stage='import ' + module, seconds=seconds))
+        print(f'import {module}: {seconds:.3f} s')
+
+    seconds = best_of(args.repeat, run_python, ['-c', 'pass'])
+    results.append(dict(stage='interpreter', seconds=seconds))
+    print(f'interpreter startup: {seconds:.3f} s')
+
+    # parameters file with a wrong value, the tool must exit before reading any data
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        f.write('SEIS_FOLDER = .\nWELL_TABLE = wells.csv\nCOLUMNS = Well,x,y,z\nRESULT_TABLE = result.csv\n'
+                'START_DEPTH = 0\nBIN_AVERAGING = maybe\nEXPANSION = 0\n')
+    try:
+        seconds = best_of(args.repeat, run_python, ['seisextractor.py', f.name], os.path.join(ROOT, 'cmd'))
+    finally:
+        os.remove(f.name)
+    results.append(dict(stage='seisextractor wrong parameters', seconds=seconds))
+    print(f'seisextractor.py with wrong parameters: {seconds:.3f} s')
+
+    with open(args.output, 'w') as f:
+        json.dump(dict(commit=git_commit(), timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'), python=platform.python_version(),
+                       platform=platform.platform(), settings=vars(args), results=results), f, indent=1)
+    print(f'Results are saved to {args.output}')
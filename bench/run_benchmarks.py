@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append("..")
+from common.classeslib import *
+from synthetic import make_dataset
+
+# Times Extractor stages on synthetic SEG-Y cubes of several sizes and writes results to JSON,
+# so that performance of different commits can be compared.
+#
+# usage: python run_benchmarks.py [--sizes 100x100x250,200x200x250] [--modes dense,sparse] [--output bench_results.json]
+
+DEFAULT_SIZES = '100x100x250,200x200x250,400x400x250'
+DEFAULT_MODES = 'dense,sparse'
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+def timed(results, record, stage, func, *args):
+# runs func(*args), appends its wall time to results, returns what func returns
+    start = time.perf_counter()
+    ok = func(*args)
+    results.append(dict(record, stage=stage, seconds=time.perf_counter() - start, ok=ok is not False))
+    print(f"{record['size']} {record['mode']} {stage}: {results[-1]['seconds']:.3f} s")
+    return ok
+
+def run_size(folder, size, modes, args, results):
+    n_inlines, n_xlines, samples = [int(v) for v in size.split('x')]
+    seis_folder, well_file = make_dataset(folder, n_inlines, n_xlines, samples, args.files, args.sort == 'inline', args.format == 'ibm',
+                                          args.wells, args.well_step)
+    base = dict(size=size, traces=n_inlines*n_xlines, samples=samples, sort=args.sort, format=args.format, files=args.files)
+    for mode in modes:
+        for bin_averaging, expansion in ((False, 0), (True, args.expansion)):
+            record = dict(base, mode=mode)
+            extractor = Extractor(True, sparse=(mode == 'sparse'), geometry_cache=False, mmap=(mode == 'mmap'))
+            prefix = 'bin_' if bin_averaging else ''
+            timed(results, record, prefix + 'scan_seismic_folder', extractor.scan_seismic_folder, seis_folder)
+            extractor.load_table(well_file)
+            extractor.set_columns_by_name('Wells', 'x', 'y', 'TVD')
+            record['well_samples'] = len(extractor.table)
+            timed(results, record, prefix + 'calc_well_grid_coords', extractor.calc_well_grid_coords, bin_averaging, expansion)
+            record['points'] = len(extractor.table)
+            for fname in extractor.filenames:
+                timed(results, dict(record, file=fname), prefix + 'extract_attribute', extractor.extract_attribute, fname)
+            timed(results, record, prefix + 'save_result_table', extractor.save_result_table, os.path.join(folder, 'result.csv'))
+        # expansion alone, on bin averaged table
+        extractor.restore_table()
+        extractor.calc_well_grid_coords(True, 0)
+        timed(results, dict(record, expansion=args.expansion), 'expand_table', extractor.expand_table, args.expansion)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark of Extractor stages on synthetic SEG-Y data')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma separated cube sizes INLINESxXLINESxSAMPLES')
+    parser.add_argument('--modes', default=DEFAULT_MODES, help='comma separated reading modes: dense, sparse, mmap')
+    parser.add_argument('--sort', default='xline', choices=['xline', 'inline'], help='fast axis of trace sorting')
+    parser.add_argument('--format', default='ieee', choices=['ieee', 'ibm'], help='sample format')
+    parser.add_argument('--files', type=int, default=2, help='number of cubes in seismic folder')
+    parser.add_argument('--wells', type=int, default=10, help='number of wells')
+    parser.add_argument('--well-step', type=float, default=0.5, help='TVD step of well samples, m')
+    parser.add_argument('--expansion', type=int, default=3, help='expansion radius for bin averaged run, in bins')
+    parser.add_argument('--workdir', default='', help='folder for synthetic data (temporary folder by default)')
+    parser.add_argument('--output', default='bench_results.json', help='JSON file for results')
+    args = parser.parse_args()
+
+    results = []
+    workdir = args.workdir or tempfile.mkdtemp(prefix='seisextractor_bench_')
+    try:
+        for size in args.sizes.split(','):
+            folder = os.path.join(workdir, size)
+            run_size(folder, size, args.modes.split(','), args, results)
+            if not args.workdir:
+                shutil.rmtree(folder)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(dict(commit=git_commit(), timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'), python=platform.python_version(),
+                       platform=platform.platform(), settings=vars(args), results=results), f, indent=1)
+    print(f'Results are saved to {args.output}')
@@ -0,0 +1,108 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Synthetic 3D SEG-Y cubes and deviated well tables for benchmarks.
+# Cubes are written directly with numpy (no per-trace segyio calls), so large cubes are generated fast.
+
+TEXT_HEADER_SIZE = 3200
+BINARY_HEADER_SIZE = 400
+TRACE_HEADER_WORDS = 60 # 240 bytes
+
+def ieee2ibm(values):
+# converts float values to IBM float words (uint32)
+    values = np.asarray(values, dtype=np.float64)
+    sign = (values < 0).astype(np.uint32) << 31
+    a = np.abs(values)
+    exponent = np.zeros(a.shape, dtype=np.int64)
+    nonzero = a > 0
+    exponent[nonzero] = np.floor(np.log2(a[nonzero])/4).astype(np.int64) + 1
+    mantissa = a / 16.0**exponent
+    # fix rounding of log2 at powers of 16
+    high = mantissa >= 1
+    exponent[high] += 1
+    mantissa[high] /= 16
+    low = nonzero & (mantissa < 1/16)
+    exponent[low] -= 1
+    mantissa[low] *= 16
+    fraction = np.floor(mantissa * 2**24).astype(np.uint32)
+    words = sign | ((exponent + 64).astype(np.uint32) << 24) | fraction
+    return np.where(nonzero, words, 0).astype(np.uint32)
+
+def grid_to_geo(inlines, xlines, origin=(500000.0, 6000000.0), bin_size=25.0, azimuth=20.0):
+# geo coordinates of (inline, xline) grid points of synthetic survey
+    angle = np.deg2rad(azimuth)
+    a = np.asarray(inlines, dtype=float)*bin_size
+    b = np.asarray(xlines, dtype=float)*bin_size
+    return origin[0] + a*np.cos(angle) - b*np.sin(angle), origin[1] + a*np.sin(angle) + b*np.cos(angle)
+
+def trace_values(inlines, xlines, samples, seed=0):
+# smooth synthetic attribute for given traces, shape (traces, samples)
+    z = np.arange(samples)[None, :]
+    il = np.asarray(inlines, dtype=float)[:, None]
+    xl = np.asarray(xlines, dtype=float)[:, None]
+    return (np.sin(il*0.05*(seed+1)) + np.cos(xl*0.07) + 0.01*z*(seed+1) + 0.3*np.sin(z*0.2 + il*0.01)).astype(np.float32)
+
+def make_cube(filename, n_inlines, n_xlines, samples, inline_fast=False, ibm=False, sample_interval=2000, seed=0, chunk_traces=20000):
+# writes synthetic SEG-Y cube with inlines 1..n_inlines and xlines 1..n_xlines.
+# Traces are sorted by inline (xline is fast) or by xline (inline_fast=True), samples are IBM (format 1) or IEEE (format 5) floats
+    if inline_fast:
+        xl_grid, il_grid = np.meshgrid(np.arange(1, n_xlines+1), np.arange(1, n_inlines+1), indexing='ij')
+    else:
+        il_grid, xl_grid = np.meshgrid(np.arange(1, n_inlines+1), np.arange(1, n_xlines+1), indexing='ij')
+    il_grid = il_grid.ravel()
+    xl_grid = xl_grid.ravel()
+    x, y = grid_to_geo(il_grid, xl_grid)
+
+    binary_header = np.zeros(BINARY_HEADER_SIZE//2, dtype='>i2')
+    binary_header[8] = sample_interval # byte 3217
+    binary_header[10] = samples # byte 3221
+    binary_header[12] = 1 if ibm else 5 # byte 3225
+    with open(filename, 'wb') as f:
+        f.write(b' '*TEXT_HEADER_SIZE)
+        f.write(binary_header.tobytes())
+        for start in range(0, len(il_grid), chunk_traces):
+            stop = min(start + chunk_traces, len(il_grid))
+            traces = np.zeros((stop-start, TRACE_HEADER_WORDS + samples), dtype='>u4')
+            half_words = traces.view('>i2')
+            half_words[:, 57] = samples # byte 115
+            half_words[:, 58] = sample_interval # byte 117
+            words = traces.view('>i4')
+            words[:, 45] = np.round(x[start:stop]) # cdp_x, byte 181
+            words[:, 46] = np.round(y[start:stop]) # cdp_y, byte 185
+            words[:, 47] = il_grid[start:stop] # inline, byte 189
+            words[:, 48] = xl_grid[start:stop] # xline, byte 193
+            values = trace_values(il_grid[start:stop], xl_grid[start:stop], samples, seed)
+            if ibm:
+                traces[:, TRACE_HEADER_WORDS:] = ieee2ibm(values)
+            else:
+                traces.view('>f4')[:, TRACE_HEADER_WORDS:] = values
+            f.write(traces.tobytes())
+
+def make_wells(n_wells, n_inlines, n_xlines, samples, sample_interval=2000, start_depth=0, step=0.5, seed=0):
+# deviated well table (Wells, x, y, TVD) inside the synthetic survey: wells go down vertically and then
+# deviate in random direction, one sample every step meters of TVD
+    rng = np.random.default_rng(seed)
+    depth_step = sample_interval//1000
+    top, bottom = start_depth + depth_step*samples*0.1, start_depth + depth_step*samples*0.9
+    tables = []
+    for well in range(n_wells):
+        tvd = np.arange(top, bottom, step)
+        kickoff = rng.uniform(top, bottom)
+        azimuth = rng.uniform(0, 2*np.pi)
+        offset = np.clip(tvd - kickoff, 0, None) * rng.uniform(0.5, 3) / 25 # in bins
+        inline = rng.uniform(0.2, 0.8)*n_inlines + offset*np.cos(azimuth)
+        xline = rng.uniform(0.2, 0.8)*n_xlines + offset*np.sin(azimuth)
+        x, y = grid_to_geo(inline, xline)
+        tables.append(pd.DataFrame({'Wells': 1000 + well, 'x': x, 'y': y, 'TVD': tvd}))
+    return pd.concat(tables, ignore_index=True)
+
+def make_dataset(folder, n_inlines, n_xlines, samples, n_files=2, inline_fast=False, ibm=False, n_wells=10, well_step=0.5):
+# synthetic seismic folder with n_files cubes and well table <folder>/wells.csv, returns (seismic folder, well table file)
+    seis_folder = os.path.join(folder, 'seismic')
+    os.makedirs(seis_folder, exist_ok=True)
+    for i in range(n_files):
+        make_cube(os.path.join(seis_folder, f'attr{i}.sgy'), n_inlines, n_xlines, samples, inline_fast, ibm, seed=i)
+    well_file = os.path.join(folder, 'wells.csv')
+    make_wells(n_wells, n_inlines, n_xlines, samples, step=well_step).to_csv(well_file, index=False)
+    return seis_folder, well_file
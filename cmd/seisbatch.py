@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.append("..")
+from seisextractor import read_params, check_params, create_extractor, scan_seismic, calc_well_points
+
+GREETING_MSG = 'SeisBatch v. 0.4: cmd tool for running several SeisExtractor jobs on the same seismic folder, reading every SEG-Y file once'
+
+USAGE_MSG = 'usage: python seisbatch.py <manifest_file>'
+
+# Manifest file lists parameters files of seisextractor.py, one per line. Jobs can have different WELL_TABLE, COLUMNS,
+# RESULT_TABLE, BIN_AVERAGING, EXPANSION, STREAM_TABLE, WINDOW_SAMPLES and PATCH_TRACES, other keys must be the same.
+# Windows are extracted for every job after its result table is saved, as by seisextractor.py
+SHARED_KEYS = ['SEIS_FOLDER', 'START_DEPTH', 'SPARSE', 'GEOMETRY_CACHE', 'MMAP', 'WORKERS', 'PREFETCH', 'MAX_MEMORY_MB', 'RESULT_CACHE']
+
+def read_manifest(fname):
+# parameters files of manifest, relative paths are relative to manifest folder
+    try:
+        with open(fname) as f:
+            lines = [line.strip() for line in f.readlines()]
+    except:
+        print(f'ERROR: Cannot open file {fname}!')
+        sys.exit()
+    params_files = [os.path.join(os.path.dirname(fname), line) for line in lines if line]
+    if len(params_files) == 0:
+        print(f'ERROR: No parameters files in manifest {fname}!')
+        sys.exit()
+    return params_files
+
+
+if __name__ == "__main__":
+
+    print(GREETING_MSG)
+    if len(sys.argv) < 2:
+        print('ERROR: You must provide a manifest file!')
+        print(USAGE_MSG)
+        sys.exit()
+
+    params_files = read_manifest(sys.argv[1])
+    jobs = [read_params(fname) for fname in params_files]
+    settings = [check_params(params) for params in jobs]
+    for key in SHARED_KEYS:
+        if any(params[key] != jobs[0][key] for params in jobs):
+            print(f'ERROR: {key} must be the same in all jobs of manifest!')
+            sys.exit()
+
+    extractor = create_extractor(jobs[0], settings[0])
+    scan_seismic(extractor, jobs[0], settings[0])
+
+    tables = []
+    point_sets = []
+    for params_file, params, job_settings in zip(params_files, jobs, settings):
+        print(f'Job {params_file}:')
+        calc_well_points(extractor, params, job_settings)
+        tables.append((extractor.table, extractor.x_col, extractor.y_col, extractor.z_col))
+        point_sets.append(extractor.well_points())
+
+    extractor.parts_folder = sys.argv[1] + '.parts'
+    workers = settings[0]['WORKERS']
+    print(f'Extracting seismic data for {len(jobs)} jobs with {workers} workers...')
+    results = extractor.extract_point_sets(point_sets, workers, prefetch=settings[0]['PREFETCH'])
+    if results is None:
+        sys.exit()
+
+    for (table, x_col, y_col, z_col), values, params, job_settings in zip(tables, results, jobs, settings):
+        for name in values:
+            table[name] = values[name]
+        extractor.table = table
+        extractor.x_col = x_col
+        extractor.y_col = y_col
+        extractor.z_col = z_col
+        if not extractor.save_result_table(params['RESULT_TABLE']):
+            sys.exit()
+        print(f'Results are saved to {params["RESULT_TABLE"]}')
+        if job_settings['WINDOW_SAMPLES'] > 0 or job_settings['PATCH_TRACES'] > 0:
+            windows_folder = os.path.splitext(params['RESULT_TABLE'])[0] + '_windows'
+            print(f'Extracting windows of +-{job_settings["WINDOW_SAMPLES"]} samples and +-{job_settings["PATCH_TRACES"]} traces...')
+            if not extractor.extract_windows(windows_folder, job_settings['WINDOW_SAMPLES'], job_settings['PATCH_TRACES']):
+                sys.exit()
+    extractor.remove_parts()
@@ -0,0 +1,40 @@
+import sys
+sys.path.append("..")
+from common.classeslib import *
+
+GREETING_MSG = 'SeisConvert v. 0.4: cmd tool for one-time conversion of a folder of SEG-Y files to a compressed brick store for SeisExtractor'
+
+USAGE_MSG = 'usage: python seisconvert.py <seis_folder> <store_folder> [brick_size]'
+
+
+if __name__ == "__main__":
+
+    print(GREETING_MSG)
+    if len(sys.argv) < 3:
+        print('ERROR: You must provide SEG-Y folder and brick store folder!')
+        print(USAGE_MSG)
+        sys.exit()
+
+    brick_size = BRICK_SIZE
+    if len(sys.argv) > 3:
+        try:
+            brick_size = int(sys.argv[3])
+        except:
+            print('ERROR: Wrong brick size!')
+            sys.exit()
+        if brick_size <= 0:
+            print('ERROR: Wrong brick size!')
+            sys.exit()
+
+    extractor = Extractor(True, mmap=True)
+    print('Scanning seismic folder...')
+    if not extractor.scan_seismic_folder(sys.argv[1]):
+        sys.exit()
+    if extractor.brick_store:
+        print(f'ERROR: {sys.argv[1]} is already a brick store!')
+        sys.exit()
+
+    print(f'Writing bricks of {brick_size} samples to {sys.argv[2]}...')
+    if not extractor.write_brick_store(sys.argv[2], brick_size):
+        sys.exit()
+    print('Done.')
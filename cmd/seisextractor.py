@@ -1,11 +1,19 @@
 import sys
+import os
+import json
+import atexit
 sys.path.append("..")
-from common.classeslib import *
+# common.classeslib (numpy, pandas) is imported by create_extractor, after parameters are checked, so that wrong parameters are reported at once
 
 GREETING_MSG = 'SeisExtractor v. 0.4: cmd tool for extracting seismic data from multiple SEG-Y files along wells with given X, Y, Z coordinates'
 
 PARAM_KEYS = {'SEIS_FOLDER', 'WELL_TABLE', 'COLUMNS', 'RESULT_TABLE', 'START_DEPTH', 'BIN_AVERAGING', 'EXPANSION'}
 
+# keys that can be omitted, with their default values
+USAGE_MSG = 'usage: python seisextractor.py <params_file> [--profile <out.json>] [--cprofile <stage>]'
+
+OPTIONAL_PARAM_KEYS = {'SPARSE': 'false', 'GEOMETRY_CACHE': 'true', 'WORKERS': '1', 'MMAP': 'false', 'PREFETCH': '0', 'MAX_MEMORY_MB': '0', 'STREAM_TABLE': 'false', 'RESULT_CACHE': '', 'WINDOW_SAMPLES': '0', 'PATCH_TRACES': '0'}
+
 def read_params(fname):
     try:
         with open(fname) as f:
@@ -20,80 +28,149 @@ def read_params(fname):
     param_values = [p.strip() for p in param_values_raw]
    
 
-    if set(param_keys) != set(PARAM_KEYS):
+    if not PARAM_KEYS.issubset(param_keys) or not set(param_keys).issubset(PARAM_KEYS | set(OPTIONAL_PARAM_KEYS)):
         print(f'ERROR: Wrong parameters in file {fname}!')
         
         sys.exit()
 
-    return  {k: v for k, v in zip(param_keys, param_values)}
-
-
-if __name__ == "__main__":    
+    params = dict(OPTIONAL_PARAM_KEYS)
+    params.update({k: v for k, v in zip(param_keys, param_values)})
+    return params
 
-    print(GREETING_MSG)
-    if len(sys.argv) < 2:
-        print('ERROR: You must provide a parameters file!')
+def read_options(args):
+# command line options after parameters file: --profile <out.json> and --cprofile <stage>
+    options = {'--profile': '', '--cprofile': ''}
+    if len(args) % 2 != 0 or not set(args[::2]).issubset(options):
+        print(f'ERROR: Wrong options {" ".join(args)}!')
+        print(USAGE_MSG)
         sys.exit()
-
-    params = read_params(sys.argv[1])       
-
-    extractor = Extractor(True)    
-    print('Scanning seismic folder...')
-    if not extractor.scan_seismic_folder(params['SEIS_FOLDER']):
-        sys.exit()    
-
-    # if columns specified
-    columns_str = params['COLUMNS']
-    column_names = columns_str.split(',')
-    if len(column_names) != 4:
-        print('ERROR: you must specify 4 column names for Well, X, Y and Depth, delimited by comma!')
+    options.update(zip(args[::2], args[1::2]))
+    return options
+
+def save_profile(extractor, events, options, result_table):
+# writes stage events to JSON file and cProfile stats of the profiled stage, called at exit.
+# Stats go next to the JSON file, or next to the result table without --profile
+    if options['--profile']:
+        try:
+            with open(options['--profile'], 'w') as f:
+                json.dump(dict(params=sys.argv[1], events=events), f, indent=1)
+            print(f'Stage profile is saved to {options["--profile"]}')
+        except OSError:
+            print(f'ERROR: Cannot save profile to {options["--profile"]}!')
+    if options['--cprofile'] and extractor.profiler is None:
+        print(f'WARNING: No stage {options["--cprofile"]} was run in the main process, cProfile stats are not collected!')
+    if extractor.profiler is not None:
+        import pstats
+        stats_file = os.path.join(os.path.dirname(options['--profile'] or result_table), f'{extractor.profile_stage}.prof')
+        try:
+            extractor.profiler.dump_stats(stats_file)
+            pstats.Stats(stats_file).sort_stats('cumulative').print_stats(20)
+            print(f'cProfile stats of stage {extractor.profile_stage} are saved to {stats_file}')
+        except OSError:
+            print(f'ERROR: Cannot save cProfile stats to {stats_file}!')
+
+
+def check_bool(params, key):
+    if not params[key] in ['true', 'false', 'True', 'False']:
+        print(f'ERROR: Wrong {key} parameter!')
         sys.exit()
+    return params[key] in ['true', 'True']
 
+def check_number(params, key, number_type=int):
     try:
-        start_depth = int(params['START_DEPTH'])
+        return number_type(params[key])
     except:
-        print('ERROR: Wrong START_DEPTH parameter!')
+        print(f'ERROR: Wrong {key} parameter!')
         sys.exit()
-    extractor.recalc_depth(start_depth)   
-
-    print(f'Starting depth is {start_depth}')
 
-    if not params['BIN_AVERAGING'] in ['true', 'false', 'True', 'False']:
-        print('ERROR: Wrong BIN_AVERAGING parameter!')
+def check_params(params):
+# checks values of parameters and converts them, exits on wrong ones
+    settings = {}
+    for key in ['SPARSE', 'GEOMETRY_CACHE', 'MMAP', 'BIN_AVERAGING', 'STREAM_TABLE']:
+        settings[key] = check_bool(params, key)
+    for key in ['WORKERS', 'PREFETCH', 'START_DEPTH', 'EXPANSION', 'WINDOW_SAMPLES', 'PATCH_TRACES']:
+        settings[key] = check_number(params, key)
+    settings['MAX_MEMORY_MB'] = check_number(params, 'MAX_MEMORY_MB', float)
+    settings['COLUMNS'] = params['COLUMNS'].split(',')
+    if len(settings['COLUMNS']) != 4:
+        print('ERROR: you must specify 4 column names for Well, X, Y and Depth, delimited by comma!')
         sys.exit()
-
-    if params['BIN_AVERAGING'] in ['true', 'True']:
-        bin_averaging = True
-    else:
-        bin_averaging = False    
-    print(f'Setting  Bin Averaging to {bin_averaging}')
-
-    try:
-        expansion = int(params['EXPANSION'])
-    except:
-        print('ERROR: Wrong EXPANSION parameter!')
+    if settings['WINDOW_SAMPLES'] < 0 or settings['PATCH_TRACES'] < 0:
+        print('ERROR: WINDOW_SAMPLES and PATCH_TRACES must not be negative!')
+        sys.exit()
+    return settings
+
+def create_extractor(params, settings):
+# extractor with reading options of parameters
+    from common.classeslib import Extractor
+    extractor = Extractor(True, settings['SPARSE'], settings['GEOMETRY_CACHE'], settings['MMAP'])    
+    extractor.max_memory_mb = settings['MAX_MEMORY_MB']
+    extractor.result_cache = params['RESULT_CACHE']
+    return extractor
+
+def scan_seismic(extractor, params, settings):
+# scans seismic folder of parameters and sets start depth
+    print('Scanning seismic folder...')
+    if not extractor.scan_seismic_folder(params['SEIS_FOLDER']):
         sys.exit()    
-            
-        
+    extractor.recalc_depth(settings['START_DEPTH'])   
+    print(f'Starting depth is {settings["START_DEPTH"]}')
+
+def calc_well_points(extractor, params, settings):
+# loads well table of parameters and calculates grid coordinates of well points
+    print(f'Setting  Bin Averaging to {settings["BIN_AVERAGING"]}')
     print('Loading well coordinates table...')
-    if not extractor.load_table(params['WELL_TABLE']):
+    if not extractor.load_table(params['WELL_TABLE'], settings['COLUMNS'] if settings['STREAM_TABLE'] else None):
         sys.exit()
 
-    if not extractor.set_columns_by_name(*column_names):
+    if not extractor.set_columns_by_name(*settings['COLUMNS']):
         sys.exit()
 
     print('Calculating well grid coordinates...')
 
     # meters to samples
-    expansion = int(np.round(expansion/extractor.bin_size)) 
-    if not extractor.calc_well_grid_coords(bin_averaging, expansion):
+    expansion = int(round(settings['EXPANSION']/extractor.bin_size)) 
+    if not extractor.calc_well_grid_coords(settings['BIN_AVERAGING'], expansion):
         sys.exit()       
 
-    print('Extracting seismic data...')
-    for fname in extractor.filenames:
-        if not extractor.extract_attribute(fname):
-            sys.exit()
+
+if __name__ == "__main__":    
+
+    print(GREETING_MSG)
+    if len(sys.argv) < 2:
+        print('ERROR: You must provide a parameters file!')
+        print(USAGE_MSG)
+        sys.exit()
+
+    params = read_params(sys.argv[1])       
+    options = read_options(sys.argv[2:])
+    settings = check_params(params)
+
+    extractor = create_extractor(params, settings)
+    # stage timings are collected for --profile, one stage can be run under cProfile
+    events = []
+    if options['--profile']:
+        extractor.listeners.append(lambda event: events.append(event) if event['event'] == 'stage' else None)
+    extractor.profile_stage = options['--cprofile']
+    atexit.register(save_profile, extractor, events, options, params['RESULT_TABLE'])
+
+    scan_seismic(extractor, params, settings)
+    calc_well_points(extractor, params, settings)
+
+    # every extracted attribute is saved to parts folder at once, so that interrupted run continues from the files not yet extracted
+    extractor.parts_folder = params['RESULT_TABLE'] + '.parts'
+    workers = settings['WORKERS']
+    print(f'Extracting seismic data with {workers} workers...')
+    if not extractor.extract_all_attributes(workers, prefetch=settings['PREFETCH']):
+        sys.exit()
 
     if not extractor.save_result_table(params['RESULT_TABLE']):
-        sys.exit()      
+        sys.exit()
+    extractor.remove_parts()
 
+    # windows around well points for ML, rows of window tensors are rows of result table
+    if settings['WINDOW_SAMPLES'] > 0 or settings['PATCH_TRACES'] > 0:
+        windows_folder = os.path.splitext(params['RESULT_TABLE'])[0] + '_windows'
+        print(f'Extracting windows of +-{settings["WINDOW_SAMPLES"]} samples and +-{settings["PATCH_TRACES"]} traces...')
+        if not extractor.extract_windows(windows_folder, settings['WINDOW_SAMPLES'], settings['PATCH_TRACES']):
+            sys.exit()
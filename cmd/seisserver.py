@@ -0,0 +1,233 @@
+import sys
+import copy
+import json
+import threading
+import collections
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+sys.path.append("..")
+from common.classeslib import *
+
+GREETING_MSG = 'SeisServer v. 0.4: local HTTP service extracting seismic data along wells, with scanned geometry and decoded cubes kept in memory'
+
+USAGE_MSG = 'usage: python seisserver.py <seis_folder> [start_depth] [port] [cache_mb]'
+
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_MB = 2048
+
+# Requests (JSON bodies and answers):
+#   GET  /attributes - file names of seismic folder and extent of the survey
+#   GET  /stats      - cube cache statistics
+#   POST /extract    - {"x": [...], "y": [...], "z": [...], "well": [...] (optional), "attributes": [...] (optional, all by default),
+#                       "bin_averaging": false, "expansion": 0 (meters)}
+#                      answers {"columns": [...], "data": [[...], ...], "seconds": ...} - well points inside the survey with
+#                      inline, xline and values of attributes, same as result table of seisextractor.py
+
+
+class CubeCache:
+# LRU cache of decoded cubes under a byte budget, shared by request threads.
+# Every cube is read once even if several requests need it at the same time
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = collections.OrderedDict() # source key (path|size|mtime) -> data, the least recently used first
+        self.sizes = {}
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.loading = {} # source key -> lock held while the file is read
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def lookup(self, key):
+    # cached data or None, counts a hit
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            return None
+
+    def get(self, key, load):
+    # cached data of key, or data returned by load() which is then cached. Returns None if load fails
+        data = self.lookup(key)
+        if data is not None:
+            return data
+        with self.lock:
+            key_lock = self.loading.setdefault(key, threading.Lock())
+        with key_lock:
+            # another request could have read it meanwhile
+            data = self.lookup(key)
+            if data is not None:
+                return data
+            data = load()
+            if data is None:
+                return None
+            with self.lock:
+                self.misses += 1
+                self.put(key, data)
+        return data
+
+    def put(self, key, data):
+    # adds data and evicts the least recently used entries to fit into budget, called under lock
+        size = sum(getattr(item, 'nbytes', 0) for item in data)
+        self.entries[key] = data
+        self.sizes[key] = size
+        self.total_bytes += size
+        while self.total_bytes > self.budget_bytes and len(self.entries) > 1:
+            old_key, _ = self.entries.popitem(last=False)
+            old_size = self.sizes.pop(old_key)
+            self.total_bytes -= old_size
+            self.evictions += 1
+            self.evicted_bytes += old_size
+            print(f'Cube {old_key} is evicted from cache ({old_size/1024**2:.0f} MB)')
+
+    def stats(self):
+        with self.lock:
+            return {'entries': list(self.entries), 'cached_mb': self.total_bytes/1024**2, 'budget_mb': self.budget_bytes/1024**2,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'evicted_mb': self.evicted_bytes/1024**2}
+
+
+class ExtractionService:
+# extractor with scanned seismic folder and cube cache, serves extraction requests of several threads
+    def __init__(self, extractor, cache_bytes):
+        self.extractor = extractor
+        self.cache = CubeCache(cache_bytes)
+        # decoded float32 cube size, cubes larger than the whole cache are read sparsely for every request
+        self.cube_bytes = int(np.count_nonzero(extractor.trace_index >= 0))*extractor.total_samples*4
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def request_extractor(self, request):
+    # copy of scanned extractor with well points of request in its table
+        extractor = copy.copy(self.extractor)
+        extractor.listeners = []
+        extractor.stage_context = threading.local()
+        extractor.parts_folder = ""
+        extractor.result_cache = ""
+        extractor.query_table = None
+        extractor.table_transform = None
+        n = len(request['x'])
+        table = pd.DataFrame({'Well': request.get('well', [0]*n), 'x': request['x'], 'y': request['y'], 'z': request['z']})
+        extractor.table = extractor.table_old = table
+        extractor.set_columns_by_name('Well', 'x', 'y', 'z')
+        return extractor
+
+    def extract(self, request):
+    # answer to extraction request, raises ValueError on wrong request
+        start = time.time()
+        if not all(key in request for key in ('x', 'y', 'z')) or not len(request['x']) == len(request['y']) == len(request['z']):
+            raise ValueError('x, y and z lists of the same length must be given')
+        attributes = request.get('attributes', self.extractor.filenames)
+        unknown = [fname for fname in attributes if fname not in self.extractor.filenames]
+        if unknown:
+            raise ValueError(f'unknown attributes {unknown}')
+        extractor = self.request_extractor(request)
+        if len(extractor.table) == 0:
+            columns = list(extractor.table.columns) + ['inline', 'xline'] + [os.path.splitext(fname)[0] for fname in attributes]
+            return {'columns': columns, 'data': [], 'seconds': time.time() - start}
+        expansion = int(np.round(float(request.get('expansion', 0))/extractor.bin_size))
+        if not extractor.calc_well_grid_coords(bool(request.get('bin_averaging', False)), expansion):
+            raise RuntimeError('Cannot calculate well grid coordinates')
+        points, nodes, inverse = extractor.query_points()
+        for fname in attributes:
+            values = self.sample(extractor, fname, points, nodes)
+            if values is None:
+                raise RuntimeError(f'Cannot process file {fname}')
+            extractor.set_attribute(fname, values[inverse], save=False)
+        with self.lock:
+            self.requests += 1
+        table = extractor.table.astype(object)
+        return {'columns': list(table.columns), 'data': table.where(table.notna(), None).values.tolist(), 'seconds': time.time() - start}
+
+    def sample(self, extractor, fname, points, nodes):
+    # values of file at unique points, from cached cube if it fits into cache
+        if len(points) == 0:
+            return np.zeros(0)
+        if extractor.brick_store or extractor.sparse or self.cube_bytes > self.cache.budget_bytes:
+            extractor.sparse = not extractor.brick_store
+            return extractor.sample_attribute(fname, points, nodes)
+        # rewritten file gets a new key, its old cube is not used and leaves the cache as the least recently used
+        loaded = self.cache.get(extractor.source_key(fname) or fname, lambda: extractor.read_attribute(fname, points, nodes))
+        if loaded is None:
+            return None
+        return extractor.interpolate_attribute(loaded, points, nodes)
+
+    def describe(self):
+        extractor = self.extractor
+        return {'seis_folder': extractor.seis_folder, 'attributes': extractor.filenames,
+                'inlines': [float(min(extractor.inlines)), float(max(extractor.inlines))],
+                'xlines': [float(min(extractor.xlines)), float(max(extractor.xlines))],
+                'depths': [float(min(extractor.depths)), float(max(extractor.depths))]}
+
+    def stats(self):
+        with self.lock:
+            requests = self.requests
+        return dict(self.cache.stats(), requests=requests)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+# JSON requests to ExtractionService of the server
+    def send_json(self, code, answer):
+        body = json.dumps(answer).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/attributes':
+            self.send_json(200, self.server.service.describe())
+        elif self.path == '/stats':
+            self.send_json(200, self.server.service.stats())
+        else:
+            self.send_json(404, {'error': f'unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/extract':
+            self.send_json(404, {'error': f'unknown path {self.path}'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            self.send_json(200, self.server.service.extract(request))
+        except (ValueError, TypeError, KeyError) as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            error_msg(f'Request failed: {e}')
+            self.send_json(500, {'error': str(e)})
+
+
+if __name__ == "__main__":
+
+    print(GREETING_MSG)
+    if len(sys.argv) < 2:
+        print('ERROR: You must provide seismic folder!')
+        print(USAGE_MSG)
+        sys.exit()
+
+    numbers = [0, DEFAULT_PORT, DEFAULT_CACHE_MB]
+    for i, arg in enumerate(sys.argv[2:5]):
+        try:
+            numbers[i] = int(arg)
+        except:
+            print(f'ERROR: Wrong argument {arg}!')
+            print(USAGE_MSG)
+            sys.exit()
+    start_depth, port, cache_mb = numbers
+
+    extractor = Extractor(True)
+    print('Scanning seismic folder...')
+    if not extractor.scan_seismic_folder(sys.argv[1]):
+        sys.exit()
+    extractor.recalc_depth(start_depth)
+    if not extractor.fit_transform():
+        sys.exit()
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), RequestHandler)
+    server.service = ExtractionService(extractor, cache_mb*1024**2)
+    print(f'Serving {len(extractor.filenames)} files of {sys.argv[1]} at http://127.0.0.1:{port} with {cache_mb} MB cube cache')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
@@ -1,33 +1,289 @@
-import segyio
 import numpy as np
 import pandas as pd
 import os
 import sys
+import shutil
 import time
+import itertools
+import hashlib
+import functools
+import contextlib
+import cProfile
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+# segyio and scipy are imported by the methods using them, so that scripts start fast and
+# paths without SEG-Y reading (brick store, geometry cache) or interpolation do not load them (see bench/import_time.py)
 
-from sklearn.linear_model import LinearRegression, RidgeCV
-from scipy.interpolate import RegularGridInterpolator
-from scipy.spatial import distance
+MMAP_CHUNK_TRACES = 10000 # traces converted at once when IBM float file is read through memory map
+PROGRESS_TRACES = 10000 # traces read between progress events (and checks for cancellation)
+TABLE_CHUNK_ROWS = 1000000 # rows of CSV well table read at once by stream_table
+EXCEL_MAX_ROWS = 1048576 # including header
+BRICK_STORE_FILE = 'brickstore.npz' # geometry and file names of brick store, written after all bricks
+BRICK_SIZE = 64 # default brick size in inlines, xlines and samples
+GEOMETRY_CACHE_VERSION = 3
+TRANSFORM_FIT_POINTS = 100000 # at most this many traces (evenly spaced) are used to fit geo->grid transform
+LINE_NEAREST_TRACES = 4 # segments around this many nearest traces are tried when well point is projected to 2D line
+LINE_MAX_DISTANCE = 1 # well points farther than this many trace spacings from 2D line are outside of it
+TRANSFORM_MAX_RESIDUAL = 0.5 # geometry is reported as bad if a trace is farther than this from the fitted transform, in inlines/xlines
+GEOMETRY_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'seisextractor') # used when cube folder is not writable
 
 def error_msg(msg):
     print(f"Error: {msg}")        
 
+def geometry_cache_paths(filename):
+# possible locations of geometry cache file for a SEG-Y file: next to it or in user cache directory
+    path_hash = hashlib.md5(os.path.abspath(filename).encode()).hexdigest()
+    return [filename + '.geom.npz', os.path.join(GEOMETRY_CACHE_DIR, f'{os.path.basename(filename)}.{path_hash}.geom.npz')]
+
+def find_cells(axis, x):
+# finds grid cell (lower and upper node indices) and normalized distance inside the cell for every x,
+# the same way as scipy RegularGridInterpolator does
+    axis = np.asarray(axis, dtype=float)
+    x = np.asarray(x, dtype=float)
+    if len(axis) < 2:
+        lower = np.zeros(len(x), dtype=np.intp)
+        return lower, lower, np.zeros(len(x))
+    lower = np.clip(np.searchsorted(axis, x, side='right') - 1, 0, len(axis) - 2)
+    upper = lower + 1
+    return lower, upper, (x - axis[lower]) / (axis[upper] - axis[lower])
+
+def nearest_nodes(axis, x):
+# indices of nearest grid nodes of axis for every x
+    axis = np.asarray(axis, dtype=float)
+    if len(axis) < 2:
+        return np.zeros(len(x), dtype=np.intp)
+    upper = np.clip(np.searchsorted(axis, x), 1, len(axis) - 1)
+    return upper - ((x - axis[upper - 1]) < (axis[upper] - x))
+
+def interpolate_linear(gather, cells):
+# linear interpolation with the same arithmetic as RegularGridInterpolator, but grid node values are taken
+# from gather(node_indices), so only the nodes around the points have to be in memory
+    value = np.array([0.])
+    for corner in itertools.product(*[((lower, 1 - dist), (upper, dist)) for lower, upper, dist in cells]):
+        node_indices, weights = zip(*corner)
+        weight = np.array([1.])
+        for w in weights:
+            weight = weight * w
+        value = value + np.asarray(gather(node_indices)) * weight
+    return value
+
+def ibm2ieee(words):
+# converts IBM floats given as uint32 words to float32
+    words = np.asarray(words, dtype=np.uint32)
+    mantissa = (words & 0x00ffffff).astype(np.float64) / 2**24
+    exponent = ((words >> 24) & 0x7f).astype(np.int64) - 64
+    values = mantissa * 16.0**exponent
+    return np.where(words >> 31, -values, values).astype(np.float32)
+
+def segy_memmap(filename):
+# memory map of trace data of SEG-Y file with fixed trace length and 4-byte IEEE (format 5) or IBM (format 1) floats.
+# Returns (traces, is_ibm), where traces is a (traces, samples) strided view of the data section 
+# (big-endian float32 or uint32 IBM words), or None if the file cannot be mapped
+    import segyio
+    try:
+        with segyio.open(filename, ignore_geometry=True) as f:
+            data_format = f.bin[segyio.BinField.Format]
+            data_offset = 3600 + 3200*f.ext_headers
+            tracecount = f.tracecount
+            samples = len(f.samples)
+    except:
+        return None
+    if data_format not in (1, 5) or os.path.getsize(filename) != data_offset + tracecount*(240 + 4*samples):
+        return None
+    is_ibm = data_format == 1
+    raw = np.memmap(filename, dtype='>u4' if is_ibm else '>f4', mode='r', offset=data_offset, shape=(tracecount, 60 + samples))
+    return raw[:, 60:], is_ibm # skip 240 bytes of trace header
+
+def peak_memory_mb():
+# peak resident memory of current process in MB, None where it cannot be measured
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/1024**2 if sys.platform == 'darwin' else peak/1024
+
+def offset_progress(progress, offset):
+# progress callback reporting file i as offset + i, or None
+    if progress is None or offset == 0:
+        return progress
+    return lambda i, fname: progress(offset + i, fname)
+
+def instrumented(func):
+# runs Extractor method as a stage of the same name (see Extractor.stage), file of the stage is the first string argument
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        fname = args[0] if args and isinstance(args[0], str) else None
+        with self.stage(func.__name__, fname):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+class GeoGridTransform:
+# affine transform between geo coordinates (X, Y) and grid coordinates (inline, xline): grid = geo @ coef.T + intercept.
+# It is fitted by least squares on header coordinates of traces and applied to any number of points with one matrix multiply
+    def __init__(self, coef, intercept):
+        self.coef = np.asarray(coef, dtype=float)
+        self.intercept = np.asarray(intercept, dtype=float)
+        self.residual_rms = 0.0 # distances of traces from the transform, in inlines/xlines
+        self.residual_max = 0.0
+
+    @classmethod
+    def fit(cls, geo_coords, grid_coords, max_points=TRANSFORM_FIT_POINTS):
+    # least squares fit on evenly spaced subsample of traces, residuals are calculated on all of them
+        step = max(1, int(np.ceil(len(geo_coords)/max_points)))
+        geo = np.asarray(geo_coords[::step], dtype=float)
+        grid = np.asarray(grid_coords[::step], dtype=float)
+        # centered, as LinearRegression does, so that large geo coordinates do not spoil the solution
+        geo_mean = geo.mean(axis=0)
+        grid_mean = grid.mean(axis=0)
+        solution = np.linalg.lstsq(geo - geo_mean, grid - grid_mean, rcond=None)[0]
+        transform = cls(solution.T, grid_mean - geo_mean @ solution)
+        transform.calc_residuals(geo_coords, grid_coords)
+        return transform
+
+    def calc_residuals(self, geo_coords, grid_coords):
+        residuals = np.hypot(*(self.to_grid(geo_coords[:, 0], geo_coords[:, 1]) - grid_coords).T)
+        self.residual_rms = float(np.sqrt(np.mean(residuals**2))) if len(residuals) > 0 else 0.0
+        self.residual_max = float(np.max(residuals)) if len(residuals) > 0 else 0.0
+
+    def to_grid(self, x, y):
+    # (inline, xline) of geo coordinates
+        return np.column_stack((x, y)).astype(float) @ self.coef.T + self.intercept
+
+    def to_geo(self, inline, xline):
+    # (X, Y) of grid coordinates. For 2D lines (constant inline) the transform is not invertible, the nearest point of the line is given
+        return (np.column_stack((inline, xline)).astype(float) - self.intercept) @ np.linalg.pinv(self.coef).T
+
+    def to_array(self):
+    # rows: coef, intercept, (residual_rms, residual_max)
+        return np.vstack((self.coef, self.intercept, [self.residual_rms, self.residual_max]))
+
+    @classmethod
+    def from_array(cls, array):
+        transform = cls(array[:2], array[2])
+        transform.residual_rms, transform.residual_max = [float(v) for v in array[3]]
+        return transform
+
+class LineTransform:
+# transform of geo coordinates to grid coordinates (1, trace number) of 2D line: every point is projected to the nearest segment 
+# of the polyline through trace CDPs, and gets fractional trace number. Works for curved and crooked lines.
+# Points farther from the line than LINE_MAX_DISTANCE trace spacings get NaN, points beyond its ends are extrapolated
+# along the end segments, so they are cropped as outside of the line.
+# Has the same methods as GeoGridTransform, KD-tree of CDPs is built once, at the first use
+    def __init__(self, geo_coords, grid_coords):
+        self.vertices = np.asarray(geo_coords, dtype=float)
+        self.grid_coords = np.asarray(grid_coords, dtype=float)
+        self.residual_rms = 0.0 # traces lie on the line
+        self.residual_max = 0.0
+        self.tree = None
+        spacings = np.hypot(*np.diff(self.vertices, axis=0).T)
+        self.max_distance = LINE_MAX_DISTANCE*(np.median(spacings[spacings > 0]) if np.any(spacings > 0) else np.inf)
+
+    @classmethod
+    def fit(cls, geo_coords, grid_coords):
+        return cls(geo_coords, grid_coords)
+
+    def to_grid(self, x, y):
+    # (1, fractional trace number) of geo coordinates, NaN for points too far from the line
+        grid, distance = self.project(x, y)
+        grid[distance > self.max_distance] = np.nan
+        return grid
+
+    def project(self, x, y):
+    # (1, fractional trace number) of projections of geo coordinates to the line, and distances to the line
+        points = np.column_stack((x, y)).astype(float)
+        if len(self.vertices) < 2:
+            return np.tile(self.grid_coords[:1], (len(points), 1)), np.hypot(*(points - self.vertices[:1]).T)
+        if self.tree is None:
+            from scipy.spatial import cKDTree
+            self.tree = cKDTree(self.vertices)
+        k = min(LINE_NEAREST_TRACES, len(self.vertices))
+        nearest = self.tree.query(points, k=k)[1].reshape(len(points), k)
+        # segments before and after every nearest trace, shape (points, 2k)
+        segments = np.clip(np.concatenate((nearest - 1, nearest), axis=1), 0, len(self.vertices) - 2)
+        start = self.vertices[segments]
+        direction = self.vertices[segments + 1] - start
+        length2 = np.sum(direction**2, axis=2)
+        offset = points[:, None, :] - start
+        projection = np.sum(offset*direction, axis=2)/np.where(length2 > 0, length2, 1)
+        t = np.clip(projection, 0, 1)
+        distance2 = np.sum((offset - t[:, :, None]*direction)**2, axis=2)
+        best = np.argmin(distance2, axis=1)
+        rows = np.arange(len(points))
+        segment, t, projection = segments[rows, best], t[rows, best], projection[rows, best]
+        # beyond the ends trace number goes on along end segments, distance is measured to their continuation
+        beyond = ((segment == 0) & (projection < 0)) | ((segment == len(self.vertices) - 2) & (projection > 1))
+        t = np.where(beyond, projection, t)
+        distance = np.hypot(*(offset[rows, best] - t[:, None]*direction[rows, best]).T)
+        return self.grid_coords[segment] + t[:, None]*(self.grid_coords[segment + 1] - self.grid_coords[segment]), distance
+
+    def to_geo(self, inline, xline):
+    # (X, Y) of fractional trace numbers along the line, inline is ignored
+        trace = np.asarray(xline, dtype=float)
+        return np.column_stack([np.interp(trace, self.grid_coords[:, 1], self.vertices[:, i]) for i in range(2)])
+
+    def to_array(self):
+    # the line is geometry itself, nothing else is saved
+        return np.zeros((0, 2))
+
+_worker_extractor = None
+_worker_points = None
+_worker_nodes = None
+_worker_events = []
+
+def init_worker(geometry_state, points, nodes, cancel_event):
+# process pool initializer: every worker gets seismic geometry and well points (and their node indices) once,
+# and cancellation event of parent extractor
+    global _worker_extractor, _worker_points, _worker_nodes
+    _worker_extractor = Extractor(geometry_state['is3D'], geometry_state['sparse'], False)
+    _worker_extractor.__dict__.update(geometry_state)
+    _worker_extractor.cancel_event = cancel_event
+    _worker_extractor.listeners.append(_worker_events.append)
+    _worker_points = points
+    _worker_nodes = nodes
+
+def extract_worker(fname):
+# samples one attribute in worker process, returns its values, worker peak memory and stage events
+    del _worker_events[:]
+    with _worker_extractor.stage('extract_attribute', fname):
+        values = _worker_extractor.sample_attribute(fname, _worker_points, _worker_nodes)
+    _worker_extractor.current_traces = [] # do not keep the cube until the next file
+    return values, peak_memory_mb(), [event for event in _worker_events if event['event'] == 'stage']
+
 class Extractor:
 
-    def __init__(self, is3D) -> None:
+    def __init__(self, is3D, sparse=False, geometry_cache=True, mmap=False) -> None:
         self.is3D = is3D
+        self.mmap = mmap # read regular IEEE/IBM float files through memory map
+        self.max_memory_mb = 0 # if whole cube is larger, it is read by slabs of inlines fitting into this budget (0 - no limit)
+        self.brick_store = False # seismic folder is a brick store made by write_brick_store
+        self.brick_size = BRICK_SIZE
+        self.current_brick_folder = ""
+        self.current_bricks = {}
+        self.sparse = sparse # read only traces and samples around well points instead of whole cubes
+        self.geometry_cache = geometry_cache # keep scanned geometry in .geom.npz file to skip header scanning next time
+        self.geometry_cache_key = ""
+        self.transform = None # GeoGridTransform fitted on trace coordinates
+        self.node_index = None # (inline, xline, sample) indices of well points when all of them lie on grid nodes
+        self.query_table = None # table for which unique points in self.query are found
+        self.query = None # (unique well points, their node indices or None, inverse index of table rows)
+        self.dedup_ratio = 1 # well points per unique point
         self.geo_coords = []
         self.grid_coords = []  
         self.inline_fast = False
         self.inlines = []
         self.xlines = []    
         self.start_depth = 0
+        self.header_start_depth = 0 # start depth of SEG-Y trace header, start_depth can be changed by recalc_depth
         self.depth_step = 0
         self.depths = []
         self.seis_folder  = ""
         self.table_file_name = ""
         self.table = pd.DataFrame()  
-        self.table_old = pd.DataFrame()             
+        self.table_old = pd.DataFrame() # table as loaded, it is never changed (processing works on shallow copies)
+        self.table_transform = None # (transform, x column, y column) used by stream_table for inline and xline of loaded table
         self.filenames = []
         self.total_samples = 0
         self.x_col = "x"
@@ -35,64 +291,309 @@ class Extractor:
         self.z_col = "TVD"
         self.well_col = "Well"
         self.current_traces = []
+        self.current_keys = []
+        self.current_first_sample = 0
+        self.trace_index = []
+        self.holes = [] # (inline, xline) nodes of the grid without traces
+        self.irregular = False # there are holes, cube is kept as live traces in file order instead of (inlines, xlines, samples) array
         self.inl_step = 0
         self.xln_step = 0
         self.bin_size = 0
+        self.scan_rate = 0 # traces/s of the last header scan
+        self.worker_memory = {} # peak memory (MB) of worker processes by file name
+        self.io_time = 0 # seconds spent reading and interpolating files by extract_prefetched
+        self.compute_time = 0
+        self.listeners = [] # callables getting event dict of every finished stage (see stage), may be called from reader thread
+        self.profile_stage = "" # name of stage to run under cProfile, stats are collected in self.profiler
+        self.profiler = None
+        self.stage_context = threading.local() # stack of running stages of each thread
+        self.cancel_event = multiprocessing.Event() # set by cancel(), shared with worker processes
+        self.parts_folder = "" # if set, every extracted attribute is saved there at once, so that interrupted extraction can be resumed
+        self.parts_key = ""
+        self.result_cache = "" # if set, extracted values are kept there by attribute and point, and reused while SEG-Y file is unchanged
         
 
+    def emit(self, event):
+    # sends event dict to all listeners
+        for listener in self.listeners:
+            listener(event)
+
+    @contextlib.contextmanager
+    def stage(self, name, fname=None):
+    # measures a stage of processing and emits event with its name, file, wall time, bytes and traces read, points interpolated,
+    # peak memory of the process (MB) and name of enclosing stage. Counts of nested stages are added to enclosing ones,
+    # stages without file take it from enclosing stage. If name is self.profile_stage, the stage runs under cProfile
+        stack = getattr(self.stage_context, 'stack', None)
+        if stack is None:
+            stack = self.stage_context.stack = []
+        parent = stack[-1] if stack else None
+        if fname is None and parent is not None:
+            fname = parent['file']
+        counters = dict(bytes_read=0, traces_read=0, points=0)
+        stack.append(dict(stage=name, file=fname, counters=counters))
+        profiler = None
+        if name == self.profile_stage and not any(s['stage'] == name for s in stack[:-1]):
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+                profiler = self.profiler
+            except ValueError: # profiler is already running in another thread
+                pass
+        start = time.time()
+        try:
+            yield counters
+        finally:
+            wall_time = time.time() - start
+            if profiler is not None:
+                profiler.disable()
+            stack.pop()
+            if parent is not None:
+                for key, value in counters.items():
+                    parent['counters'][key] += value
+            self.emit(dict(event='stage', stage=name, file=fname, parent=parent['stage'] if parent else None, wall_time=wall_time, 
+                           peak_rss_mb=peak_memory_mb(), **counters))
+
+    def report_progress(self, fname, done, total, unit='traces'):
+    # emits progress event of processing file fname in current stage, returns False if processing is cancelled
+        stack = getattr(self.stage_context, 'stack', None)
+        self.emit(dict(event='progress', stage=stack[-1]['stage'] if stack else None, file=fname, done=int(done), total=int(total), unit=unit))
+        if self.cancel_event.is_set():
+            print(f'Processing of file {fname} is cancelled')
+            return False
+        return True
+
+    def cancel(self):
+    # stops running extraction (can be called from another thread): reading stops at the next progress report
+    # and extract_all_attributes returns False. Cleared when the next extraction starts
+        self.cancel_event.set()
+
+    def count(self, bytes_read=0, traces_read=0, points=0):
+    # adds to counters of the current stage of this thread, if any
+        stack = getattr(self.stage_context, 'stack', None)
+        if not stack:
+            return
+        counters = stack[-1]['counters']
+        counters['bytes_read'] += int(bytes_read)
+        counters['traces_read'] += int(traces_read)
+        counters['points'] += int(points)
+
     def calc_bin_size(self):
-        #print(distance.euclidean(self.geo_coords[0], self.geo_coords[1]))
-        self.bin_size = np.round(distance.euclidean(self.geo_coords[0], self.geo_coords[1]))
+        self.bin_size = np.round(np.linalg.norm(np.asarray(self.geo_coords[0], dtype=float) - self.geo_coords[1]))
        
         
 
+    @instrumented
     def scan_seismic_folder(self, folder_name, cdpx_byte=181, cdpy_byte=185, inline_byte=189, xline_byte=193):
         if not os.path.exists(folder_name) or not os.path.isdir(folder_name):
             error_msg(f"Folder {folder_name} does not exist!")
             return False
         self.seis_folder = folder_name                
+        self.brick_store = False
+        if os.path.isfile(os.path.join(folder_name, BRICK_STORE_FILE)):
+            return self.load_brick_store(folder_name)
         print(f'Scanning SEG-Y headers of first file in folder {self.seis_folder}...')
         self.filenames = [fname for fname in os.listdir(self.seis_folder) if fname.endswith('.sgy') or fname.endswith('.segy')]
         if len(self.filenames) == 0:
             error_msg(f'No SEG-Y files in folder {self.seisfolder}!')
             return False
 
+        first_file = os.path.join(self.seis_folder, self.filenames[0])
+        self.transform = None
+        self.geometry_cache_key = ""
+        if self.geometry_cache:
+            st = os.stat(first_file)
+            self.geometry_cache_key = f'{os.path.abspath(first_file)}|{st.st_size}|{st.st_mtime_ns}|{cdpx_byte},{cdpy_byte},{inline_byte},{xline_byte}|{self.is3D}|{GEOMETRY_CACHE_VERSION}'
+            if self.load_geometry_cache(first_file):
+                return True
+
+        import segyio
+        start = time.time()
         with segyio.open(os.path.join(self.seis_folder, self.filenames[0]), ignore_geometry=True) as f:
-            self.geo_coords = []
-            self.grid_coords = []
-            for i in range(f.tracecount):
-                self.geo_coords.append([f.header[i][cdpx_byte], f.header[i][cdpy_byte]])
-                if self.is3D:
-                    self.grid_coords.append([f.header[i][inline_byte], f.header[i][xline_byte]])            
-                else:
-                    self.grid_coords.append([1, i]) # in case of 2D, inline is constant and xline = trace number
+            # whole header words are read at once as arrays
+            self.geo_coords = np.column_stack((f.attributes(cdpx_byte)[:], f.attributes(cdpy_byte)[:])).astype(np.int64)
+            if self.is3D:
+                self.grid_coords = np.column_stack((f.attributes(inline_byte)[:], f.attributes(xline_byte)[:])).astype(np.int64)
+            else:
+                # in case of 2D, inline is constant and xline = trace number
+                self.grid_coords = np.column_stack((np.ones(f.tracecount, dtype=np.int64), np.arange(f.tracecount)))
             self.depth_step = f.bin[segyio.BinField.Interval]//1000
             self.total_samples = f.bin[segyio.BinField.Samples]
-            self.start_depth = f.header[0][segyio.TraceField.LagTimeA]
+            self.header_start_depth = self.start_depth = f.header[0][segyio.TraceField.LagTimeA]
+        scan_time = time.time() - start
+        self.scan_rate = len(self.grid_coords)/max(scan_time, 1e-9)
+        print(f'{len(self.grid_coords)} trace headers are scanned for {scan_time:.2f} seconds ({self.scan_rate:.0f} traces/s)')
         self.depths = np.arange(self.start_depth, self.start_depth+self.depth_step*self.total_samples, self.depth_step)
-        self.grid_coords = np.array(self.grid_coords)
-        self.geo_coords = np.array(self.geo_coords)
         self.inlines = np.unique(self.grid_coords[:, 0])
         self.xlines = np.unique(self.grid_coords[:, 1])
-        self.inl_step = np.round(np.mean(np.diff(self.inlines)))    
+        # trace number for every (inline, xline) node of the grid
+        self.trace_index = np.full((len(self.inlines), len(self.xlines)), -1, dtype=np.int64)
+        self.trace_index[np.searchsorted(self.inlines, self.grid_coords[:, 0]), np.searchsorted(self.xlines, self.grid_coords[:, 1])] = np.arange(len(self.grid_coords))
+        self.calc_hole_mask()
+        self.inl_step = np.round(np.mean(np.diff(self.inlines))) if len(self.inlines) > 1 else 1 # 2D line has one inline
         self.xln_step = np.round(np.mean(np.diff(self.xlines)))             
-        if self.grid_coords[0,0] != self.grid_coords[2,0]:
-            self.inline_fast = True
+        # inline is the fast axis if it changes from trace to trace more often than xline (works for cropped surveys too)
+        self.inline_fast = bool(np.count_nonzero(np.diff(self.grid_coords[:, 0])) > np.count_nonzero(np.diff(self.grid_coords[:, 1])))
         self.calc_bin_size()          
+        if self.geometry_cache:
+            self.save_geometry_cache()
         return True    
 
+    def calc_hole_mask(self):
+    # marks grid nodes without traces. Irregular (cropped, polygon-outlined) surveys are sampled from live traces only,
+    # so memory needed for a cube depends on the number of traces, not on its bounding box
+        self.holes = self.trace_index < 0
+        self.irregular = bool(np.any(self.holes))
+        if self.irregular:
+            print(f'Seismic geometry is irregular: {self.trace_index.size - np.count_nonzero(self.holes)} traces on a grid of '
+                  f'{len(self.inlines)}x{len(self.xlines)}, {np.count_nonzero(self.holes)} nodes are holes')
+
+    def hole_points(self, points, nodes=None):
+    # mask of points which cannot be sampled because some of grid nodes around them are holes
+        if nodes is not None:
+            return self.holes[nodes[0], nodes[1]]
+        (il_lower, il_upper, _), (xl_lower, xl_upper, _), _ = self.point_cells(points)
+        return self.holes[il_lower, xl_lower] | self.holes[il_lower, xl_upper] | self.holes[il_upper, xl_lower] | self.holes[il_upper, xl_upper]
+
+    def save_geometry_cache(self):
+    # saves scanned geometry (and regression, if already fitted) of the first file of seismic folder
+        if not self.geometry_cache_key:
+            return False
+        first_file = os.path.join(self.seis_folder, self.filenames[0])
+        for cache_file in geometry_cache_paths(first_file):
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+                with open(cache_file + '.tmp', 'wb') as f:
+                    np.savez(f, key=np.array(self.geometry_cache_key), **self.geometry_arrays())
+                os.replace(cache_file + '.tmp', cache_file)
+                return True
+            except OSError:
+                continue
+        error_msg(f'Cannot save geometry cache for file {first_file}')
+        return False
+
+    def load_geometry_cache(self, filename):
+    # loads geometry saved by save_geometry_cache, if the cache is made for the same file (path, size, mtime) and header bytes
+        for cache_file in geometry_cache_paths(filename):
+            if not os.path.isfile(cache_file):
+                continue
+            try:
+                with np.load(cache_file) as cache:
+                    if str(cache['key']) != self.geometry_cache_key:
+                        continue
+                    self.set_geometry_arrays(cache)
+            except Exception:
+                continue
+            print(f'Geometry of file {filename} is loaded from cache {cache_file}')
+            return True
+        return False
+
+    def geometry_arrays(self):
+    # scanned geometry and regression as a dict of arrays, to be saved with np.savez
+        transform = self.transform.to_array() if self.transform is not None else np.zeros((0, 2))
+        return dict(inlines=self.inlines, xlines=self.xlines, trace_index=self.trace_index, geo_coords=self.geo_coords, inline_fast=self.inline_fast, 
+                    steps=np.array([self.inl_step, self.xln_step, self.bin_size]), depth=np.array([self.header_start_depth, self.depth_step, self.total_samples]), 
+                    transform=transform)
+
+    def set_geometry_arrays(self, arrays):
+    # restores geometry from arrays made by geometry_arrays
+        self.inlines = arrays['inlines']
+        self.xlines = arrays['xlines']
+        self.trace_index = arrays['trace_index']
+        self.calc_hole_mask()
+        self.geo_coords = arrays['geo_coords']
+        self.inline_fast = bool(arrays['inline_fast'])
+        self.inl_step, self.xln_step, self.bin_size = arrays['steps']
+        self.header_start_depth, self.depth_step, self.total_samples = [int(v) for v in arrays['depth']]
+        self.start_depth = self.header_start_depth
+        il_idx, xl_idx = np.nonzero(self.trace_index >= 0)
+        self.grid_coords = np.empty((len(self.geo_coords), 2), dtype=np.int64)
+        self.grid_coords[self.trace_index[il_idx, xl_idx]] = np.column_stack((self.inlines[il_idx], self.xlines[xl_idx]))
+        if not self.is3D:
+            # 2D line transform is made of geometry itself
+            self.transform = LineTransform(self.geo_coords, self.grid_coords)
+        elif 'transform' in arrays and len(arrays['transform']) > 0:
+            self.transform = GeoGridTransform.from_array(arrays['transform'])
+        elif 'intercept' in arrays and len(arrays['intercept']) > 0:
+            # brick stores written before GeoGridTransform keep regression coefficients only
+            self.transform = GeoGridTransform(arrays['coef'], arrays['intercept'])
+        self.depths = np.arange(self.start_depth, self.start_depth+self.depth_step*self.total_samples, self.depth_step)
+
+    @instrumented
+    def write_brick_store(self, store_folder, brick_size=BRICK_SIZE):
+    # converts all cubes of seismic folder to compressed bricks of brick_size^3 samples: <store_folder>/<attribute>/<i>_<j>_<k>.npz,
+    # and saves scanned geometry to <store_folder>/brickstore.npz. Cubes are read by slabs of brick_size inlines, 
+    # so memory does not depend on cube size
+        try:
+            os.makedirs(store_folder, exist_ok=True)
+        except OSError:
+            error_msg(f'Cannot create folder {store_folder}!')
+            return False
+        for fname in self.filenames:
+            filename = os.path.join(self.seis_folder, fname)
+            start = time.time()
+            attribute_folder = os.path.join(store_folder, os.path.splitext(fname)[0])
+            os.makedirs(attribute_folder, exist_ok=True)
+            for i in range(0, len(self.inlines), brick_size):
+                last = min(i + brick_size, len(self.inlines))
+                keys = np.arange(i*len(self.xlines), last*len(self.xlines))
+                if self.irregular:
+                    keys = keys[~self.holes.ravel()[keys]]
+                traces = self.read_traces(filename, keys, 0, self.total_samples)
+                if traces is None:
+                    if not self.cancel_event.is_set():
+                        error_msg(f'Cannot load file {filename}!')
+                    return False
+                if self.irregular:
+                    # live traces are put to their nodes of the slab, holes are NaN
+                    slab = np.full(((last-i)*len(self.xlines), self.total_samples), np.nan, dtype=np.float32)
+                    slab[keys - i*len(self.xlines)] = traces
+                    slab = slab.reshape(last-i, len(self.xlines), self.total_samples)
+                else:
+                    slab = traces.reshape(last-i, len(self.xlines), self.total_samples)
+                for j in range(0, len(self.xlines), brick_size):
+                    for k in range(0, self.total_samples, brick_size):
+                        brick = slab[:, j:j+brick_size, k:k+brick_size]
+                        np.savez_compressed(os.path.join(attribute_folder, f'{i//brick_size}_{j//brick_size}_{k//brick_size}.npz'), 
+                                            data=brick.astype(np.float32))
+                traces = slab = None
+                if not self.report_progress(filename, last, len(self.inlines), 'inlines'):
+                    return False
+            print(f'File {fname} is written to {attribute_folder} for {(time.time()-start):.2f} seconds')
+        np.savez(os.path.join(store_folder, BRICK_STORE_FILE), filenames=np.array(self.filenames), brick_size=brick_size, **self.geometry_arrays())
+        return True
+
+    def load_brick_store(self, store_folder):
+    # reads geometry of brick store, its attributes are then read from bricks
+        try:
+            with np.load(os.path.join(store_folder, BRICK_STORE_FILE)) as store:
+                self.set_geometry_arrays(store)
+                self.filenames = [str(fname) for fname in store['filenames']]
+                self.brick_size = int(store['brick_size'])
+        except Exception:
+            error_msg(f'Cannot read brick store {store_folder}!')
+            return False
+        self.brick_store = True
+        print(f'Brick store {store_folder} with {len(self.filenames)} attributes is opened')
+        return True
+
     def recalc_depth(self, new_start_depth):
         if new_start_depth >= 0:
             self.start_depth = new_start_depth
             self.depths = np.arange(self.start_depth, self.start_depth+self.depth_step*self.total_samples, self.depth_step)
 
-    def load_table(self, table_file_name):
+    @instrumented
+    def load_table(self, table_file_name, columns=None):
+    # reads well table, or only its (well, x, y, depth) columns if they are given (see stream_table)
         self.table_file_name = table_file_name
         if not os.path.exists(self.table_file_name) or not os.path.isfile(self.table_file_name):
             error_msg(f'File {self.table_file_name} does not exist!')
             return False
          
         self.table_file_name = table_file_name
+        self.table_transform = None
+        if columns is not None:
+            return self.stream_table(columns)
         if self.table_file_name.endswith('.xlsx'):
             try:
                 self.table = pd.read_excel(self.table_file_name)
@@ -114,12 +615,56 @@ class Extractor:
             error_msg(f'Empty table in file {self.table_file_name}!')   
             return False
 
-        self.table_old = self.table.copy()    
+        self.table_old = self.table
 
         return True    
 
+    def stream_table(self, columns):
+    # reads only (well, x, y, depth) columns of well table: CSV in chunks of TABLE_CHUNK_ROWS rows, text well names are kept 
+    # as categories. If seismic is already scanned, inline and xline of every chunk are calculated right away, so that 
+    # calc_well_grid_coords does not have to do it for the whole table
+        if len(columns) != 4 or len(set(columns)) != 4:
+            error_msg('Four different column names for Well, X, Y and Depth must be given!')
+            return False
+        well_col, x_col, y_col, z_col = columns
+        dtypes = {x_col: np.float64, y_col: np.float64, z_col: np.float64}
+        map_chunks = len(self.geo_coords) > 0 and self.fit_transform()
+        chunks = []
+        try:
+            if self.table_file_name.endswith('.xlsx'):
+                reader = [pd.read_excel(self.table_file_name, usecols=list(columns), dtype=dtypes)]
+            else:
+                reader = pd.read_csv(self.table_file_name, usecols=list(columns), dtype=dtypes, chunksize=TABLE_CHUNK_ROWS)
+            for chunk in reader:
+                if chunk[well_col].dtype == object:
+                    chunk[well_col] = chunk[well_col].astype('category')
+                if map_chunks:
+                    grid_coords = self.geo_to_grid(chunk[x_col].values, chunk[y_col].values)
+                    chunk['inline'] = grid_coords[:, 0]
+                    chunk['xline'] = grid_coords[:, 1]
+                chunks.append(chunk)
+        except Exception as e:
+            error_msg(f'Cannot read columns {", ".join(columns)} of table file {self.table_file_name}: {e}')
+            return False
+        if len(chunks) == 0 or sum(len(chunk) for chunk in chunks) == 0:
+            error_msg(f'Empty table in file {self.table_file_name}!')   
+            return False
+        wells = [chunk[well_col] for chunk in chunks]
+        if all(isinstance(w.dtype, pd.CategoricalDtype) for w in wells):
+            # chunks get the same categories, otherwise concat would convert them back to strings
+            categories = pd.api.types.union_categoricals(wells).categories
+            for chunk in chunks:
+                chunk[well_col] = pd.Categorical(chunk[well_col], categories=categories)
+        self.table = pd.concat(chunks, ignore_index=True)
+        chunks = wells = None
+        self.table_old = self.table
+        self.table_transform = (self.transform, x_col, y_col) if map_chunks else None
+        self.set_columns_by_name(*columns)
+        print(f'{len(self.table)} rows of columns {", ".join(columns)} are read from {self.table_file_name}')
+        return True
+
     def restore_table(self):
-        self.table = self.table_old.copy()    
+        self.table = self.table_old
 
     def set_columns_by_name(self, new_well_col, new_x_col, new_y_col, new_z_col):
         if not {new_well_col, new_x_col, new_y_col, new_z_col}.issubset(set(self.table.columns)):
@@ -131,6 +676,7 @@ class Extractor:
         self.z_col = new_z_col
         return True
 
+    @instrumented
     def calc_well_grid_coords(self, bin_averaging, expansion):
     # Finds dependecy between geo coordinates and grid coordinates using regression and then calculates well grid coordinates
         #print(self.depths)
@@ -139,17 +685,18 @@ class Extractor:
         if len(self.table)==0 or len(self.geo_coords)==0 or len(self.grid_coords)==0 or len(self.depths)==0:
             error_msg('For calculation of well grid coordinates, seismic geo and grid coordinates and well geo coordinates must be present!')
             return False
-        rgr = LinearRegression()
+        if not self.fit_transform():
+            return False
+        self.table = self.table.copy(deep=False) # loaded table is kept unchanged for restore_table
+        # inline and xline of streamed table are valid while transform and coordinate columns are the same
+        if self.table_transform is None or self.table_transform[0] is not self.transform or self.table_transform[1:] != (self.x_col, self.y_col):
+            self.well_grid_coords = self.geo_to_grid(self.table.loc[:, self.x_col].values, self.table.loc[:, self.y_col].values)
+            self.table['inline'] = self.well_grid_coords[:, 0]
+            self.table['xline'] = self.well_grid_coords[:, 1]
         if not self.is3D:
-            rgr = RidgeCV() # For 3D case linear regression is sufficient, but for curved 2D lines there must be something more complicated    
-        try:            
-            rgr.fit(self.geo_coords, self.grid_coords)
-            self.well_grid_coords = rgr.predict(np.column_stack((self.table.loc[:, self.x_col].values, self.table.loc[:, self.y_col].values)))
-        except:
-            error_msg('Cannot perform regression to calculate well grid coordinates!')
-            return False            
-        self.table['inline'] = self.well_grid_coords[:, 0]
-        self.table['xline'] = self.well_grid_coords[:, 1]
+            off_line = np.count_nonzero(np.isnan(self.table.xline.values))
+            if off_line > 0:
+                print(f'{off_line} of {len(self.table)} well points are farther than {LINE_MAX_DISTANCE} trace spacing from 2D line, they are cropped')
 
         
        
@@ -159,8 +706,50 @@ class Extractor:
                 self.expand_table(expansion)
         self.crop_table()
         #print(self.table.head(10))
+        self.node_index = None
+        if bin_averaging:
+            # computed once here and used for all files
+            self.node_index = self.calc_node_index(self.well_points())
+            if self.node_index is not None:
+                print('Well points lie on grid nodes, seismic values will be taken without interpolation')
+        if self.irregular:
+            in_holes = np.count_nonzero(self.hole_points(self.well_points(), self.node_index))
+            if in_holes > 0:
+                print(f'{in_holes} of {len(self.table)} well points fall into holes of seismic geometry, their values will be NaN')
         return True
 
+    def fit_transform(self):
+    # fits transform of geo coordinates of seismic traces to grid coordinates, unless it is already fitted (or loaded from cache)
+        if self.transform is not None:
+            return True
+        try:            
+            # curved 2D lines are not affine, their traces are found by projection to the line
+            self.transform = (GeoGridTransform if self.is3D else LineTransform).fit(self.geo_coords, self.grid_coords)
+        except Exception:
+            error_msg('Cannot perform regression to calculate well grid coordinates!')
+            return False            
+        print(f'Geo to grid transform is fitted, residual RMS {self.transform.residual_rms:.3f}, max {self.transform.residual_max:.3f} inlines/xlines')
+        if self.is3D and self.transform.residual_max > TRANSFORM_MAX_RESIDUAL:
+            print(f'WARNING: trace coordinates do not fit regular grid (residual up to {self.transform.residual_max:.2f} inlines/xlines), check geometry of seismic data!')
+        if self.geometry_cache:
+            self.save_geometry_cache()
+        return True
+
+    def geo_to_grid(self, x, y):
+    # (inline, xline) of geo coordinates
+        return self.transform.to_grid(x, y)
+
+    def calc_node_index(self, points):
+    # integer (inline, xline, sample) indices of points if all of them lie exactly on grid nodes, otherwise None
+        node_index = []
+        for axis, x in zip((self.inlines, self.xlines, self.depths), points.T):
+            idx = np.clip(np.searchsorted(axis, x), 0, len(axis) - 1)
+            if not np.array_equal(axis[idx], x):
+                return None
+            node_index.append(idx)
+        return tuple(node_index)
+
+    @instrumented
     def table_bin_average(self):
     # well samples averaging inside a bin corresponding to seismic cube sampling + horizontal expansion
         
@@ -173,33 +762,28 @@ class Extractor:
       
         
 
+    @instrumented
     def expand_table(self, expansion):
-        new_table = pd.DataFrame(columns=self.table.columns)
-        for well in pd.unique(self.table[self.well_col]):
-            temp_table = self.table[self.table[self.well_col]==well].reset_index(drop=True)            
-            append_table = pd.DataFrame(columns=temp_table.columns)
-            j = 0
-            for i in range(len(temp_table)):                            
-                neighbours_inl = np.arange(temp_table.loc[i, 'inline']-expansion*self.inl_step, temp_table.loc[i, 'inline']+expansion*self.inl_step+self.inl_step, self.inl_step)
-                neighbours_xln = np.arange(temp_table.loc[i, 'xline']-expansion*self.inl_step, temp_table.loc[i, 'xline']+expansion*self.inl_step+self.inl_step, self.xln_step)                                                            
-                for nl in neighbours_inl:
-                    for nx in neighbours_xln:
-                        d = distance.euclidean((nl, nx), (temp_table.loc[i, 'inline'], temp_table.loc[i, 'xline'])) 
-                        #print(d)
-                        if d<=expansion:
-                            new_row = temp_table.iloc[i].copy()
-                            #print('NEW ROW:',new_row)
-                            new_row['inline'] = int(nl)
-                            new_row['xline'] = int(nx)
-                            append_table.loc[j] = new_row
-                            j+=1          
-
-            new_table = pd.concat([new_table, append_table], ignore_index=True).sort_values(by=['inline', 'xline', self.z_col])               
-        self.table = new_table.copy().groupby(['inline', 'xline', self.z_col]).mean().reset_index()      
+    # copies every well sample to neighbouring inlines and xlines inside expansion radius, then averages samples in the same bin
+        # stencil of (inline, xline) offsets inside the radius
+        offsets_inl, offsets_xln = np.meshgrid(np.arange(-expansion*self.inl_step, expansion*self.inl_step+self.inl_step, self.inl_step),
+                                               np.arange(-expansion*self.inl_step, expansion*self.inl_step+self.inl_step, self.xln_step), indexing='ij')
+        inside = np.sqrt(offsets_inl**2 + offsets_xln**2) <= expansion
+        offsets_inl = offsets_inl[inside]
+        offsets_xln = offsets_xln[inside]
+        # well by well, so that samples are averaged in the same order as before
+        well_codes, _ = pd.factorize(self.table[self.well_col])
+        table = self.table.iloc[np.argsort(well_codes, kind='stable')]
+        table = table[np.sort(well_codes) >= 0]
+        new_table = pd.DataFrame({col: np.repeat(table[col].values, len(offsets_inl)) for col in table.columns})
+        new_table['inline'] = np.trunc(table.inline.values[:, None] + offsets_inl[None, :]).ravel()
+        new_table['xline'] = np.trunc(table.xline.values[:, None] + offsets_xln[None, :]).ravel()
+        self.table = new_table.groupby(['inline', 'xline', self.z_col]).mean().reset_index()      
         
 
 
 
+    @instrumented
     def crop_table(self):
     # Crops table according to seismic data extent        
         self.table=self.table[(self.table.inline>=min(self.inlines))&(self.table.inline<=max(self.inlines))]
@@ -209,58 +793,728 @@ class Extractor:
 
     def load_cube(self, filename):
     # simply reads trace data from file    
+        traces = self.read_cube(filename)
+        if traces is None:
+            return False
+        self.current_traces = traces
+        return True
+
+    def read_cube(self, filename):
+    # returns all traces of file or None, does not change extractor state
         start = time.time()
+        if self.mmap:
+            traces = self.map_traces(filename)
+            if traces is not None:
+                print(f'File {filename} is mapped for {(time.time()-start):.2f} seconds')
+                self.count(bytes_read=traces.nbytes, traces_read=len(traces))
+                return traces
+            if self.cancel_event.is_set():
+                return None
+            print(f'File {filename} cannot be memory-mapped, reading it with segyio')
+        import segyio
         try:
             with segyio.open(filename, ignore_geometry=True) as f:
-                self.current_traces = np.array([f.trace[i] for i in range(f.tracecount)])
-        except:
-            error_msg('Cannot load file {filename}')        
-            return False
+                traces = np.empty((f.tracecount, len(f.samples)), dtype=f.dtype)
+                for i in range(0, f.tracecount, PROGRESS_TRACES):
+                    last = min(i + PROGRESS_TRACES, f.tracecount)
+                    traces[i:last] = f.trace.raw[i:last]
+                    if not self.report_progress(filename, last, f.tracecount):
+                        return None
+        except Exception as e:
+            error_msg(f'Cannot load file {filename}: {e}')        
+            return None
         print(f'File {filename} is read for {(time.time()-start):.2f} seconds')    
+        self.count(bytes_read=traces.nbytes, traces_read=len(traces))
+        return traces
+
+    def map_traces(self, filename, trace_numbers=None, first_sample=0, last_sample=None):
+    # traces (all or given ones) and samples window of file through memory map. IEEE float data is returned as a view 
+    # without copying (the OS page cache keeps it between runs), IBM float data is converted in chunks of traces.
+    # Returns None if the file cannot be memory-mapped
+        mapped = segy_memmap(filename)
+        if mapped is None:
+            return None
+        traces, is_ibm = mapped
+        if trace_numbers is not None:
+            traces = traces[trace_numbers]
+        traces = traces[:, first_sample:last_sample]
+        if not is_ibm:
+            return traces
+        converted = np.empty(traces.shape, dtype=np.float32)
+        for i in range(0, len(traces), MMAP_CHUNK_TRACES):
+            converted[i:i+MMAP_CHUNK_TRACES] = ibm2ieee(traces[i:i+MMAP_CHUNK_TRACES])
+            if not self.report_progress(filename, min(i + MMAP_CHUNK_TRACES, len(traces)), len(traces)):
+                return None
+        return converted
+
+    def cube_data(self):
+    # current_traces as (inlines, xlines, samples) array
+        if not self.inline_fast:
+            return self.current_traces.reshape(len(self.inlines), len(self.xlines), self.total_samples)
+        return self.current_traces.reshape(len(self.xlines), len(self.inlines), self.total_samples).transpose((1,0,2))        
+
+    def gather_bricks(self, node_indices):
+    # values at given (inline, xline, sample) node indices from bricks of current attribute, each brick is read once per attribute
+        il, xl, z = node_indices
+        b = self.brick_size
+        brick_ids, inverse = np.unique(np.column_stack((il // b, xl // b, z // b)), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(brick_ids) + 1))
+        values = np.empty(len(il), dtype=np.float32)
+        for n, (bi, bj, bk) in enumerate(brick_ids):
+            brick = self.current_bricks.get((bi, bj, bk))
+            if brick is None:
+                with np.load(os.path.join(self.current_brick_folder, f'{bi}_{bj}_{bk}.npz')) as f:
+                    brick = f['data']
+                self.current_bricks[(bi, bj, bk)] = brick
+                self.count(bytes_read=brick.nbytes)
+            idx = order[bounds[n]:bounds[n+1]]
+            values[idx] = brick[il[idx] - bi*b, xl[idx] - bj*b, z[idx] - bk*b]
+        return values
+
+    @instrumented
+    def sample_bricks(self, fname, points, nodes=None):
+    # samples attribute from brick store, decompressing only bricks with grid nodes around points
+        start = time.time()
+        self.current_brick_folder = os.path.join(self.seis_folder, os.path.splitext(fname)[0])
+        self.current_bricks = {}
+        try:
+            if nodes is not None:
+                values = self.gather_bricks(nodes).astype(float)
+            else:
+                values = interpolate_linear(self.gather_bricks, self.point_cells(points))
+        except OSError:
+            error_msg(f'Cannot read bricks of {fname}!')
+            return None
+        print(f'{len(self.current_bricks)} bricks of {fname} are read for {(time.time()-start):.2f} seconds')
+        self.count(points=len(points))
+        self.current_bricks = {}
+        return values
+
+    def well_points(self):
+    # (inline, xline, depth) of well points in self.table
+        return np.column_stack((self.table.inline, self.table.xline, self.table.loc[:, self.z_col]))
+
+    def point_cells(self, points):
+    # grid cells around points in inline, xline and depth directions
+        return [find_cells(self.inlines, points[:, 0]), find_cells(self.xlines, points[:, 1]), find_cells(self.depths, points[:, 2])]
+
+    def calc_trace_window(self, cells):
+    # finds traces (as inline_index*len(xlines)+xline_index keys) and sample window needed for interpolation at given cells
+        (il_lower, il_upper, _), (xl_lower, xl_upper, _), (z_lower, z_upper, _) = cells
+        keys = np.unique(np.concatenate([il*len(self.xlines) + xl for il in (il_lower, il_upper) for xl in (xl_lower, xl_upper)]))
+        if self.irregular:
+            keys = keys[~self.holes.ravel()[keys]]
+        if len(keys) == 0:
+            return keys, 0, 0
+        return keys, int(np.min(z_lower)), int(np.max(z_upper)) + 1
+
+    def load_traces(self, filename, keys, first_sample, last_sample):
+    # reads only given traces and samples window from file
+        traces = self.read_traces(filename, keys, first_sample, last_sample)
+        if traces is None:
+            return False
+        self.current_traces = traces
+        self.current_keys = keys
+        self.current_first_sample = first_sample
         return True
-        
 
-    def extract_attribute(self, fname):
-    # extracts attribute values from current_traces along well coordinates            
+    def read_traces(self, filename, keys, first_sample, last_sample):
+    # returns given traces and samples window of file or None, does not change extractor state
+        start = time.time()
+        trace_numbers = self.trace_index.ravel()[keys]
+        if self.mmap:
+            traces = self.map_traces(filename, trace_numbers, first_sample, last_sample)
+            if traces is not None:
+                print(f'File {filename}: {len(keys)} traces, samples {first_sample}-{last_sample} are mapped for {(time.time()-start):.2f} seconds')
+                self.count(bytes_read=traces.nbytes, traces_read=len(traces))
+                return traces
+            if self.cancel_event.is_set():
+                return None
+        import segyio
+        try:
+            with segyio.open(filename, ignore_geometry=True) as f:
+                if len(keys) > 0 and np.all(np.diff(trace_numbers) == 1) and first_sample == 0 and last_sample == len(f.samples):
+                    # whole traces in a row are read at once
+                    traces = f.trace.raw[int(trace_numbers[0]):int(trace_numbers[-1])+1]
+                else:
+                    traces = np.empty((len(keys), last_sample-first_sample), dtype=f.dtype)
+                    for n, k in enumerate(np.argsort(trace_numbers)): # file order
+                        traces[k] = f.trace[int(trace_numbers[k]), first_sample:last_sample]
+                        if (n + 1) % PROGRESS_TRACES == 0 and not self.report_progress(filename, n + 1, len(keys)):
+                            return None
+        except Exception as e:
+            error_msg(f'Cannot load file {filename}: {e}')
+            return None
+        print(f'File {filename}: {len(keys)} traces, samples {first_sample}-{last_sample} are read for {(time.time()-start):.2f} seconds')
+        self.count(bytes_read=traces.nbytes, traces_read=len(traces))
+        return traces
+
+    def gather_traces(self, node_indices):
+    # values of loaded traces at given (inline, xline, sample) node indices
+        il, xl, z = node_indices
+        if not self.irregular:
+            rows = np.searchsorted(self.current_keys, il*len(self.xlines) + xl)
+            return self.current_traces[rows, z - self.current_first_sample]
+        # holes are not loaded
+        if len(self.current_keys) == 0:
+            return np.full(len(il), np.nan)
+        rows = np.minimum(np.searchsorted(self.current_keys, il*len(self.xlines) + xl), len(self.current_keys) - 1)
+        return np.where(self.holes[il, xl], np.nan, self.current_traces[rows, z - self.current_first_sample])
+
+    def gather_live(self, node_indices):
+    # values of whole irregular cube (live traces in file order) at given (inline, xline, sample) node indices, NaN in holes
+        il, xl, z = node_indices
+        rows = self.trace_index[il, xl]
+        return np.where(rows >= 0, self.current_traces[rows, z], np.nan)
+
+    def sample_attribute(self, fname, points, nodes=None):
+    # samples seismic data of file fname at (inline, xline, depth) points, returns None on failure.
+    # If node indices of points are given, values are taken directly from grid nodes without interpolation
         if not fname in self.filenames:
             error_msg('Invalid file name!')
-            return False        
-        if not self.load_cube(os.path.join(self.seis_folder, fname)):
-            error_msg('Cannot load seismic files!')
-            return False      
-        data = []                          
-        if not self.inline_fast:
-            data = self.current_traces.reshape(len(self.inlines), len(self.xlines), self.total_samples)
-        else:
-            data = self.current_traces.reshape(len(self.xlines), len(self.inlines), self.total_samples).transpose((1,0,2))        
+            return None
+        if self.brick_store:
+            return self.sample_bricks(fname, points, nodes)
+        if self.use_slabs():
+            return self.sample_slabs(fname, points, nodes)
+        loaded = self.read_attribute(fname, points, nodes)
+        if loaded is None:
+            if not self.cancel_event.is_set():
+                error_msg('Cannot load seismic files!')
+            return None
+        return self.interpolate_attribute(loaded, points, nodes)
+
+    def use_slabs(self):
+    # whole cube does not fit into memory budget and is going to be read by slabs
+        return not self.sparse and self.max_memory_mb > 0 and np.count_nonzero(self.trace_index >= 0)*self.total_samples*4 > self.max_memory_mb*2**20
+
+    @instrumented
+    def sample_slabs(self, fname, points, nodes=None):
+    # samples file fname at points reading it by slabs of inlines that fit into max_memory_mb. Points are bucketed by
+    # inline cell, every slab is read once and overlaps the next one by one inline, so results are the same as for whole cube
+        slab_inlines = int(self.max_memory_mb*2**20 // (len(self.xlines)*self.total_samples*4)) - 1
+        if slab_inlines < 1:
+            error_msg(f'Memory budget of {self.max_memory_mb} MB is too small to read two inlines of file {fname}!')
+            return None
+        filename = os.path.join(self.seis_folder, fname)
+        lower = nodes[0] if nodes is not None else find_cells(self.inlines, points[:, 0])[0]
+        slab_numbers = lower // slab_inlines
+        values = np.empty(len(points))
+        slabs = np.unique(slab_numbers)
+        for n, slab in enumerate(slabs):
+            idx = np.nonzero(slab_numbers == slab)[0]
+            first = slab*slab_inlines
+            last = min(first + slab_inlines + 1, len(self.inlines))
+            keys = (np.arange(first, last)[:, None]*len(self.xlines) + np.arange(len(self.xlines))[None, :]).ravel()
+            if self.irregular:
+                keys = keys[~self.holes.ravel()[keys]]
+            traces = self.read_traces(filename, keys, 0, self.total_samples)
+            if traces is None:
+                if not self.cancel_event.is_set():
+                    error_msg('Cannot load seismic files!')
+                return None
+            if self.irregular:
+                # live traces of the slab are gathered by their keys
+                self.current_traces, self.current_keys, self.current_first_sample = traces, keys, 0
+                if nodes is not None:
+                    values[idx] = self.gather_traces(tuple(node[idx] for node in nodes))
+                else:
+                    values[idx] = interpolate_linear(self.gather_traces, self.point_cells(points[idx]))
+                self.current_traces = []
+            elif nodes is not None:
+                data = traces.reshape(last-first, len(self.xlines), self.total_samples)
+                values[idx] = data[nodes[0][idx]-first, nodes[1][idx], nodes[2][idx]]
+            else:
+                from scipy.interpolate import RegularGridInterpolator
+                data = traces.reshape(last-first, len(self.xlines), self.total_samples)
+                values[idx] = RegularGridInterpolator((self.inlines[first:last], self.xlines, self.depths), data)(points[idx])
+            traces = data = None
+            if not self.report_progress(filename, n + 1, len(slabs), 'slabs'):
+                return None
+        self.count(points=len(points))
+        return values
+
+    @instrumented
+    def read_attribute(self, fname, points, nodes=None):
+    # reads data of file fname needed to sample it at points: whole cube, or only traces around points in sparse mode.
+    # Returns (traces, keys, first_sample) with keys=None for whole cube, or None on failure.
+    # Does not change extractor state, so it can run in a background thread
+        filename = os.path.join(self.seis_folder, fname)
+        if not self.sparse:
+            traces = self.read_cube(filename)
+            return None if traces is None else (traces, None, 0)
+        cells = [(idx, idx, None) for idx in nodes] if nodes is not None else self.point_cells(points)
+        keys, first_sample, last_sample = self.calc_trace_window(cells)
+        traces = self.read_traces(filename, keys, first_sample, last_sample)
+        return None if traces is None else (traces, keys, first_sample)
+
+    @instrumented
+    def interpolate_attribute(self, loaded, points, nodes=None):
+    # samples data returned by read_attribute at points (or directly at grid nodes, if given)
+        self.current_traces, self.current_keys, self.current_first_sample = loaded
+        self.count(points=len(points))
+        if self.current_keys is not None:
+            if nodes is not None:
+                return self.gather_traces(nodes).astype(float)
+            return interpolate_linear(self.gather_traces, self.point_cells(points))
+        if self.irregular:
+            if nodes is not None:
+                return self.gather_live(nodes).astype(float)
+            return interpolate_linear(self.gather_live, self.point_cells(points))
+        data = self.cube_data()
+        if nodes is not None:
+            return data[nodes].astype(float)
+        from scipy.interpolate import RegularGridInterpolator
         interpolator = RegularGridInterpolator((self.inlines, self.xlines, self.depths), data)    
-        seismic_values = []               
-        well_grid_coords = np.column_stack((self.table.inline, self.table.xline, self.table.loc[:, self.z_col]))         
-        well_seismic = interpolator(well_grid_coords)          
-        seismic_values.extend(well_seismic)
-        attribute_name = os.path.splitext(fname)[0]
-        self.table[attribute_name] = seismic_values
-    
+        return interpolator(points)
+
+    @instrumented
+    def extract_attribute(self, fname):
+    # extracts attribute values from file fname along well coordinates            
+        points, nodes, inverse = self.query_points()
+        values = self.sample_attribute(fname, points, nodes)
+        if values is None:
+            return False
+        self.set_attribute(fname, values[inverse])
         return True    
 
-    def save_result_table(self, fname):
-    # saves table with extracted data
-        attribute_names = [os.path.splitext(fname)[0] for fname in self.filenames] 
-        if fname.endswith('.xlsx'):
-            try:
-                self.table.drop([self.x_col, self.y_col], axis=1).to_excel(fname)
-            except:
-                error_msg(f'Cannot save Excel file {fname}!')
-                return False
+    def query_points(self):
+    # unique well points, their node indices (if any) and inverse index to rows of table. Rows with the same (inline, xline, depth), 
+    # from neighbouring wells or overlapping expansion, are sampled once. Found once for every table
+        if self.query_table is not self.table:
+            points = self.well_points()
+            unique_points, first_rows, inverse = np.unique(points, axis=0, return_index=True, return_inverse=True)
+            nodes = None if self.node_index is None else tuple(idx[first_rows] for idx in self.node_index)
+            self.query = (unique_points, nodes, inverse.ravel())
+            self.query_table = self.table
+            self.dedup_ratio = len(points)/max(len(unique_points), 1)
+            print(f'{len(points)} well points are sampled at {len(unique_points)} unique locations (deduplication ratio {self.dedup_ratio:.2f})')
+        return self.query
+
+    def set_attribute(self, fname, values, save=True):
+    # adds extracted values of file fname to table, keeping columns in order of self.filenames, and saves them to parts_folder
+        attribute_name = os.path.splitext(fname)[0]
+        if save and self.parts_folder:
+            self.save_part(fname, values)
+        if save and self.result_cache:
+            self.update_cache(fname, self.well_points(), values)
+        if attribute_name in self.table.columns:
+            self.table[attribute_name] = values
+            return
+        later = [os.path.splitext(f)[0] for f in self.filenames[self.filenames.index(fname)+1:]]
+        self.table.insert(len(self.table.columns) - sum(name in self.table.columns for name in later), attribute_name, values)
+
+    def part_files(self, fname):
+    # values file and key file of attribute part
+        part_file = os.path.join(self.parts_folder, os.path.splitext(fname)[0] + '.npy')
+        return part_file, part_file + '.key'
+
+    def source_key(self, fname):
+    # identifies extracted values of file fname: file path, size and mtime, and depth axis. Bricks of brick store are rewritten 
+    # in place by seisconvert.py (folder mtime does not change), so its attributes are identified by brickstore.npz written last
+        path = os.path.join(self.seis_folder, BRICK_STORE_FILE if self.brick_store else fname)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return ''
+        return f'{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{self.start_depth}|{self.depth_step}'
+
+    def part_key(self, fname):
+    # part is valid for the same file and well points
+        source_key = self.source_key(fname)
+        return f'{source_key}|{self.parts_key}' if source_key else ''
+
+    def save_part(self, fname, values):
+    # saves attribute values to parts_folder, key file is written last, so an incomplete part is never used
+        part_file, key_file = self.part_files(fname)
+        try:
+            with open(part_file + '.tmp', 'wb') as f:
+                np.save(f, values)
+            os.replace(part_file + '.tmp', part_file)
+            with open(key_file + '.tmp', 'w') as f:
+                f.write(self.part_key(fname))
+            os.replace(key_file + '.tmp', key_file)
+        except OSError:
+            error_msg(f'Cannot save extracted values of {fname} to {self.parts_folder}')
+            return False
+        return True
+
+    def load_part(self, fname):
+    # values of attribute saved by save_part if they are valid for current well points, otherwise None
+        part_file, key_file = self.part_files(fname)
+        try:
+            with open(key_file) as f:
+                if f.read() != self.part_key(fname):
+                    return None
+            values = np.load(part_file)
+        except (OSError, ValueError):
+            return None
+        return values if len(values) == len(self.table) else None
+
+    def resume_parts(self):
+    # loads attributes saved to parts_folder by interrupted extraction, returns file names that still have to be extracted 
+    # (or None if parts folder cannot be created)
+        if not self.parts_folder:
+            return list(self.filenames)
+        try:
+            os.makedirs(self.parts_folder, exist_ok=True)
+        except OSError:
+            error_msg(f'Cannot create folder {self.parts_folder}!')
+            return None
+        self.parts_key = hashlib.md5(np.ascontiguousarray(self.well_points()).tobytes()).hexdigest()
+        filenames = []
+        for fname in self.filenames:
+            values = self.load_part(fname)
+            if values is None:
+                filenames.append(fname)
+            else:
+                self.set_attribute(fname, values, save=False)
+        if len(filenames) < len(self.filenames):
+            print(f'{len(self.filenames) - len(filenames)} attributes are resumed from {self.parts_folder}')
+        return filenames
+
+    def cache_file(self, fname):
+        return os.path.join(self.result_cache, os.path.splitext(fname)[0] + '.npz')
+
+    def load_cache(self, fname):
+    # (points, values) of attribute from result cache, if it is made for the same file, otherwise None
+        source_key = self.source_key(fname)
+        try:
+            with np.load(self.cache_file(fname)) as cache:
+                if not source_key or str(cache['key']) != source_key:
+                    return None
+                return cache['points'], cache['values']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def cached_values(self, fname, points):
+    # values of attribute at points from result cache and mask of points missing there (all points, if there is no valid cache)
+        values = np.full(len(points), np.nan)
+        cache = self.load_cache(fname)
+        if cache is None:
+            return values, np.ones(len(points), dtype=bool)
+        cached_points, cached_values = cache
+        rows = pd.MultiIndex.from_arrays(cached_points.T).get_indexer(pd.MultiIndex.from_arrays(points.T))
+        values[rows >= 0] = cached_values[rows[rows >= 0]]
+        return values, rows < 0
+
+    def update_cache(self, fname, points, values):
+    # adds values at points to result cache of attribute (points of other well tables stay there)
+        cache = self.load_cache(fname)
+        if cache is not None:
+            points = np.concatenate((points, cache[0]))
+            values = np.concatenate((values, cache[1]))
+        points, unique_rows = np.unique(points, axis=0, return_index=True)
+        cache_file = self.cache_file(fname)
+        try:
+            os.makedirs(self.result_cache, exist_ok=True)
+            with open(cache_file + '.tmp', 'wb') as f:
+                np.savez(f, key=np.array(self.source_key(fname)), points=points, values=values[unique_rows])
+            os.replace(cache_file + '.tmp', cache_file)
+        except OSError:
+            error_msg(f'Cannot save result cache of {fname} to {self.result_cache}')
+            return False
+        return True
+
+    def extract_cached(self, filenames):
+    # takes values of files from result cache. Returns files without valid cache, to be extracted as usual, and
+    # dict of files found in cache only partly: file name -> (values with NaN at missing points, indices of missing points)
+        points, nodes, inverse = self.query_points()
+        filenames_left = []
+        missing_points = {}
+        for fname in filenames:
+            values, missing = self.cached_values(fname, points)
+            if np.all(missing):
+                filenames_left.append(fname)
+                continue
+            idx = np.nonzero(missing)[0]
+            print(f'File {fname}: {len(points) - len(idx)} of {len(points)} points are taken from result cache')
+            if len(idx) > 0:
+                missing_points[fname] = (values, idx)
+            else:
+                self.set_attribute(fname, values[inverse], save=False)
+        return filenames_left, missing_points
+
+    def extract_missing(self, missing_points, workers=1, progress=None, prefetch=0):
+    # samples files found in result cache only partly (see extract_cached) at missing points. Only traces around these points
+    # are read, whatever self.sparse is. Files with the same missing points are extracted together by extract_files
+        points, nodes, inverse = self.query_points()
+        groups = {}
+        for fname, (_, idx) in missing_points.items():
+            groups.setdefault(idx.tobytes(), []).append(fname)
+        done = 0
+        sparse = self.sparse
+        self.sparse = True
+        try:
+            for fnames in groups.values():
+                idx = missing_points[fnames[0]][1]
+                query = (points[idx], None if nodes is None else tuple(node[idx] for node in nodes), np.arange(len(idx)))
+                def store(fname, sampled):
+                    values = missing_points[fname][0]
+                    values[idx] = sampled
+                    self.set_attribute(fname, values[inverse])
+                if not self.extract_files(fnames, workers, offset_progress(progress, done), prefetch, query, store):
+                    return False
+                done += len(fnames)
+        finally:
+            self.sparse = sparse
+        return True
+
+    def remove_parts(self):
+    # removes parts folder, when results are saved or extraction is cancelled
+        if self.parts_folder and os.path.isdir(self.parts_folder):
+            shutil.rmtree(self.parts_folder, ignore_errors=True)
+
+    def extract_prefetched(self, prefetch, progress=None, filenames=None, query=None, store=None):
+    # pipelined extraction: reader thread reads files into a queue of at most prefetch items, 
+    # main thread interpolates them. At most prefetch+2 cubes (or trace subsets) are in memory at once.
+    # query and store are the same as in extract_files
+        filenames = self.filenames if filenames is None else filenames
+        points, nodes, inverse = self.query_points() if query is None else query
+        store = self.set_attribute if store is None else store
+        read_queue = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+        self.io_time = 0
+        self.compute_time = 0
+
+        def reader():
+            for fname in filenames:
+                start = time.time()
+                try:
+                    loaded = self.read_attribute(fname, points, nodes)
+                except Exception as e:
+                    # main thread must not wait for a file which will never come
+                    error_msg(f'Cannot load file {fname}: {e}')
+                    loaded = None
+                self.io_time += time.time() - start
+                while not stop.is_set():
+                    try:
+                        read_queue.put((fname, loaded), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if loaded is None or stop.is_set():
+                    return
+
+        start = time.time()
+        thread = threading.Thread(target=reader, daemon=True)
+        thread.start()
+        try:
+            for i in range(len(filenames)):
+                fname, loaded = read_queue.get()
+                if loaded is None:
+                    if not self.cancel_event.is_set():
+                        error_msg(f'Cannot load file {fname}!')
+                    return False
+                compute_start = time.time()
+                with self.stage('extract_attribute', fname):
+                    store(fname, self.interpolate_attribute(loaded, points, nodes)[inverse])
+                self.current_traces = []
+                loaded = None
+                self.compute_time += time.time() - compute_start
+                if progress:
+                    progress(i, fname)
+        finally:
+            stop.set()
+            thread.join()
+        print(f'{len(filenames)} files are processed for {(time.time()-start):.2f} seconds: ' 
+              f'I/O {self.io_time:.2f} seconds, interpolation {self.compute_time:.2f} seconds')
+        return True
+
+    def extract_point_sets(self, point_sets, workers=1, progress=None, prefetch=0):
+    # extracts attributes at several arrays of (inline, xline, depth) points, reading every file once for all of them.
+    # Returns {attribute: values} for every array of points, or None on failure. Well table is not changed
+        table, z_col, node_index = self.table, self.z_col, self.node_index
+        points, inverse = np.unique(np.concatenate(point_sets), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        print(f'{len(inverse)} points of {len(point_sets)} sets are extracted as {len(points)} unique points')
+        self.table = pd.DataFrame({'inline': points[:, 0], 'xline': points[:, 1], 'depth': points[:, 2]})
+        self.z_col = 'depth'
+        # points of bin averaged sets lie on grid nodes, but interpolation at nodes gives the same values
+        self.node_index = self.calc_node_index(points)
+        try:
+            if not self.extract_all_attributes(workers, progress, prefetch):
+                return None
+            attribute_names = [os.path.splitext(fname)[0] for fname in self.filenames]
+            bounds = np.cumsum([0] + [len(p) for p in point_sets])
+            return [{name: self.table[name].values[inverse[bounds[i]:bounds[i+1]]] for name in attribute_names} for i in range(len(point_sets))]
+        finally:
+            self.table, self.z_col, self.node_index = table, z_col, node_index
+
+    def window_nodes(self, half_window, half_patch=0):
+    # (inline, xline, sample) node indices of windows around nearest nodes of well points, with shape (points, samples) 
+    # or (points, traces, traces, samples) if half_patch > 0, and mask of nodes inside the cube
+        points = self.well_points()
+        il, xl, z = [nearest_nodes(axis, x) for axis, x in zip((self.inlines, self.xlines, self.depths), points.T)]
+        window = np.arange(-half_window, half_window + 1)
+        if half_patch > 0:
+            patch = np.arange(-half_patch, half_patch + 1)
+            il = il[:, None, None, None] + patch[None, :, None, None]
+            xl = xl[:, None, None, None] + patch[None, None, :, None]
+            z = z[:, None, None, None] + window[None, None, None, :]
         else:
-            try:
-                self.table.drop([self.x_col, self.y_col], axis=1).to_csv(fname, index=False)
-            except:
-                error_msg(f'Cannot save CSV table file {fname}')
+            il, xl, z = il[:, None], xl[:, None], z[:, None] + window[None, :]
+        il, xl, z = np.broadcast_arrays(il, xl, z)
+        inside = (il >= 0) & (il < len(self.inlines)) & (xl >= 0) & (xl < len(self.xlines)) & (z >= 0) & (z < self.total_samples)
+        inside[inside] = self.trace_index[il[inside], xl[inside]] >= 0
+        return (il, xl, z), inside
+
+    @instrumented
+    def extract_windows(self, folder, half_window, half_patch=0):
+    # extracts vertical windows of +-half_window samples (and inline/xline patches of +-half_patch traces) around nearest 
+    # grid nodes of well points, for ML. Every attribute is written to memory-mapped <folder>/<attribute>.npy of float32
+    # with shape (points, samples) or (points, traces, traces, samples), row i is row i of table. Nodes outside the cube are NaN
+        try:
+            os.makedirs(folder, exist_ok=True)
+        except OSError:
+            error_msg(f'Cannot create folder {folder}!')
+            return False
+        nodes, inside = self.window_nodes(half_window, half_patch)
+        # every file is gathered once at all nodes of all windows
+        nodes = tuple(idx[inside] for idx in nodes)
+        points = np.column_stack((self.inlines[nodes[0]], self.xlines[nodes[1]], self.depths[nodes[2]]))
+        for fname in self.filenames:
+            values = self.sample_attribute(fname, points, nodes)
+            if values is None:
                 return False
-        return True        
+            windows = np.lib.format.open_memmap(os.path.join(folder, os.path.splitext(fname)[0] + '.npy'), mode='w+', 
+                                                dtype=np.float32, shape=inside.shape)
+            windows[...] = np.nan
+            windows[inside] = values
+            windows.flush()
+            del windows
+            print(f'Windows of {fname} with shape {inside.shape} are written to {folder}')
+        return True
 
-        
-        
+    def geometry_state(self):
+    # attributes needed to sample seismic data in another process (without well table)
+        names = ['is3D', 'sparse', 'mmap', 'max_memory_mb', 'brick_store', 'brick_size', 'seis_folder', 'filenames', 'inlines', 'xlines', 'depths', 'total_samples', 'inline_fast', 
+                 'trace_index', 'holes', 'irregular']
+        return {name: getattr(self, name) for name in names}
+
+    @instrumented
+    def extract_all_attributes(self, workers=1, progress=None, prefetch=0):
+    # extracts attributes from all files of seismic folder, in a pool of worker processes if workers > 1.
+    # With one worker and prefetch > 0, next files are read in background thread while current one is interpolated.
+    # Columns are added to self.table in order of self.filenames, progress(i, fname) is called after each file.
+    # With parts_folder, attributes already extracted by interrupted run with the same points are taken from there,
+    # with result_cache only points missing in the cache are sampled
+        self.cancel_event.clear()
+        filenames = self.resume_parts()
+        if filenames is None:
+            return False
+        missing_points = {}
+        if self.result_cache:
+            filenames, missing_points = self.extract_cached(filenames)
+        resumed = [fname for fname in self.filenames if fname not in filenames and fname not in missing_points]
+        if progress:
+            for i, fname in enumerate(resumed):
+                progress(i, fname)
+        if missing_points and not self.extract_missing(missing_points, workers, offset_progress(progress, len(resumed)), prefetch):
+            return False
+        if len(filenames) == 0:
+            return True
+        return self.extract_files(filenames, workers, offset_progress(progress, len(resumed) + len(missing_points)), prefetch)
+
+    def extract_files(self, filenames, workers=1, progress=None, prefetch=0, query=None, store=None):
+    # samples files in a pool of worker processes if workers > 1, with prefetch thread if prefetch > 0, or one by one. 
+    # query is (unique points, their node indices, inverse index to table rows), unique well points of the table by default.
+    # store(fname, values) gets values of every file for table rows, set_attribute by default
+        query = self.query_points() if query is None else query
+        store = self.set_attribute if store is None else store
+        points, nodes, inverse = query
+        if workers <= 1 and prefetch > 0 and not self.brick_store and not self.use_slabs():
+            return self.extract_prefetched(prefetch, progress, filenames, query, store)
+        if workers <= 1:
+            for i, fname in enumerate(filenames):
+                with self.stage('extract_attribute', fname):
+                    values = self.sample_attribute(fname, points, nodes)
+                    if values is None:
+                        return False
+                    store(fname, values[inverse])
+                if progress:
+                    progress(i, fname)
+            return True
+
+        start = time.time()
+        workers = min(workers, len(filenames))
+        self.worker_memory = {}
+        geometry_state = self.geometry_state()
+        geometry_state['max_memory_mb'] = self.max_memory_mb/workers # memory budget is shared by workers
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(geometry_state, points, nodes, self.cancel_event))
+        try:
+            for i, (fname, (values, peak_memory, events)) in enumerate(zip(filenames, pool.map(extract_worker, filenames))):
+                if values is None:
+                    if not self.cancel_event.is_set():
+                        error_msg(f'Cannot process file {fname}!')
+                    return False
+                store(fname, values[inverse])
+                self.worker_memory[fname] = peak_memory
+                for event in events:
+                    self.emit(dict(event, worker=True))
+                if peak_memory is not None:
+                    print(f'File {fname} is processed, worker peak memory {peak_memory:.0f} MB')
+                if progress:
+                    progress(i, fname)
+        except Exception as e:
+            error_msg(f'Parallel extraction failed: {e}')
+            return False
+        finally:
+            pool.shutdown(cancel_futures=True)
+        print(f'{len(filenames)} files are processed by {workers} workers for {(time.time()-start):.2f} seconds')
+        return True
+
+    @instrumented
+    def save_result_table(self, fname):
+    # saves table with extracted data (without X and Y columns). Format is chosen by extension: .xlsx, .parquet and .feather 
+    # (need pyarrow), .npz (array per column), .npy (structured array), otherwise CSV. Columns are written without copying the table
+        columns = [col for col in self.table.columns if col not in (self.x_col, self.y_col)]
+        extension = os.path.splitext(fname)[1].lower()
+        if extension == '.xlsx' and len(self.table) >= EXCEL_MAX_ROWS:
+            error_msg(f'{len(self.table)} rows do not fit into Excel sheet, save results to .parquet, .feather, .npz, .npy or .csv file!')
+            return False
+        try:
+            if extension == '.xlsx':
+                self.table.to_excel(fname, columns=columns)
+            elif extension in ('.parquet', '.feather'):
+                import pyarrow
+                arrow_table = pyarrow.Table.from_pandas(self.table, columns=columns, preserve_index=False)
+                if extension == '.parquet':
+                    import pyarrow.parquet
+                    pyarrow.parquet.write_table(arrow_table, fname)
+                else:
+                    import pyarrow.feather
+                    pyarrow.feather.write_feather(arrow_table, fname)
+            elif extension == '.npz':
+                np.savez(fname, **{str(col): self.column_array(col) for col in columns})
+            elif extension == '.npy':
+                self.save_npy(fname, columns)
+            else:
+                self.table.to_csv(fname, columns=columns, index=False)
+        except ImportError:
+            error_msg(f'Package pyarrow is needed to save {extension} files!')
+            return False
+        except Exception as e:
+            error_msg(f'Cannot save file {fname}: {e}')
+            return False
+        return True
+
+    def column_array(self, col):
+    # values of table column as numpy array: numeric ones without copying, others as strings
+        if pd.api.types.is_numeric_dtype(self.table[col]):
+            return self.table[col].values
+        return self.table[col].astype(str).values.astype(str)
 
-        
\ No newline at end of file
+    def save_npy(self, fname, columns):
+    # writes columns to memory-mapped structured .npy file one by one
+        dtypes = []
+        for col in columns:
+            dtype = self.table[col].dtype if pd.api.types.is_numeric_dtype(self.table[col]) else self.column_array(col).dtype
+            dtypes.append((str(col), dtype))
+        result = np.lib.format.open_memmap(fname, mode='w+', dtype=dtypes, shape=(len(self.table),))
+        for col in columns:
+            result[str(col)] = self.column_array(col)
+        result.flush()
+        del result
@@ -8,6 +8,8 @@
 # run again.  Do not edit this file unless you know what you are doing.
 
 
+import os
+
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 def create_non_editable_item(text):
@@ -20,7 +22,7 @@ def create_non_editable_item(text):
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
         MainWindow.setObjectName("MainWindow")
-        MainWindow.resize(483, 870)
+        MainWindow.resize(483, 900)
 
         self.centralwidget = QtWidgets.QWidget(MainWindow)
         self.centralwidget.setObjectName("centralwidget")
@@ -91,12 +93,12 @@ class Ui_MainWindow(object):
         self.label_5.setGeometry(QtCore.QRect(10, 30, 34, 16))
         self.label_5.setObjectName("label_5")
 
-        self.table_WellData = QtWidgets.QTableWidget(self.group_Wells)
+        # model/view table, rows are rendered only when visible (model is set in main.py)
+        self.table_WellData = QtWidgets.QTableView(self.group_Wells)
         self.table_WellData.setGeometry(QtCore.QRect(10, 60, 441, 231))
         self.table_WellData.setObjectName("table_WellData")
-        self.table_WellData.setColumnCount(4)
-        self.table_WellData.setColumnWidth(0, 80)     
-        self.table_WellData.setRowCount(0)
+        self.table_WellData.horizontalHeader().setDefaultSectionSize(80)
+        self.table_WellData.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
 
         self.label_choose_wellcol = QtWidgets.QLabel(self.group_Wells)
         self.label_choose_wellcol.setGeometry(QtCore.QRect(10, 310, 160, 20))
@@ -142,16 +144,44 @@ class Ui_MainWindow(object):
         self.button_ScanWellFile.setGeometry(QtCore.QRect(400, 30, 51, 22))
         self.button_ScanWellFile.setObjectName("button_ScanWellFile")
 
+        self.checkbox_sparse = QtWidgets.QCheckBox(self.centralwidget)
+        self.checkbox_sparse.setText("Read only traces near wells")
+        self.checkbox_sparse.setGeometry(QtCore.QRect(20, 818, 170, 20))
+        self.checkbox_sparse.setObjectName("checkbox_sparse")
+
+        self.label_workers = QtWidgets.QLabel(self.centralwidget)
+        self.label_workers.setText("Workers:")
+        self.label_workers.setGeometry(QtCore.QRect(195, 818, 55, 20))
+        self.spinbox_workers = QtWidgets.QSpinBox(self.centralwidget)
+        self.spinbox_workers.setGeometry(QtCore.QRect(250, 818, 55, 20))
+        self.spinbox_workers.setRange(1, os.cpu_count() or 1)
+        self.spinbox_workers.setObjectName("spinbox_workers")
+
+        # files read ahead while the current one is interpolated, with one worker
+        self.label_prefetch = QtWidgets.QLabel(self.centralwidget)
+        self.label_prefetch.setText("Read ahead:")
+        self.label_prefetch.setGeometry(QtCore.QRect(320, 818, 70, 20))
+        self.spinbox_prefetch = QtWidgets.QSpinBox(self.centralwidget)
+        self.spinbox_prefetch.setGeometry(QtCore.QRect(390, 818, 60, 20))
+        self.spinbox_prefetch.setRange(0, 8)
+        self.spinbox_prefetch.setValue(1)
+        self.spinbox_prefetch.setObjectName("spinbox_prefetch")
+
         self.button_Extract = QtWidgets.QPushButton(self.centralwidget)
-        self.button_Extract.setGeometry(QtCore.QRect(180, 820, 105, 23))
+        self.button_Extract.setGeometry(QtCore.QRect(180, 850, 105, 23))
         self.button_Extract.setObjectName("button_Extract")
 
         self.progressBar = QtWidgets.QProgressBar(self.centralwidget)
-        self.progressBar.setGeometry(QtCore.QRect(10, 820, 475, 32))
+        self.progressBar.setGeometry(QtCore.QRect(10, 850, 375, 32))
         self.progressBar.setProperty("value", 0)
         self.progressBar.setProperty("visible", False)        
         self.progressBar.setObjectName("progressBar")
 
+        self.button_Cancel = QtWidgets.QPushButton(self.centralwidget)
+        self.button_Cancel.setGeometry(QtCore.QRect(390, 854, 85, 23))
+        self.button_Cancel.setProperty("visible", False)
+        self.button_Cancel.setObjectName("button_Cancel")
+
 
         MainWindow.setCentralWidget(self.centralwidget)
 
@@ -188,6 +218,7 @@ class Ui_MainWindow(object):
         self.label_5.setText(_translate("MainWindow", "File:"))
         self.button_ScanWellFile.setText(_translate("MainWindow", "Scan"))
         self.button_Extract.setText(_translate("MainWindow", "Extract"))
+        self.button_Cancel.setText(_translate("MainWindow", "Cancel"))
     
         self.actionOpen_folder.setText(_translate("MainWindow", "Open folder"))
         self.actionOpen_single_file.setText(_translate("MainWindow", "Open single file"))
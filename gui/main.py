@@ -1,12 +1,11 @@
 import sys  # 
 import os
+import time
 
 from PyQt5 import QtWidgets, QtCore
 import numpy as np
 import pandas as pd
 
-from sklearn.linear_model import LinearRegression
-from scipy.interpolate import RegularGridInterpolator
 
 import design  # PyQt Design file
 
@@ -14,8 +13,67 @@ sys.path.append("..")
 from common.classeslib import *
 
 
+class DataFrameModel(QtCore.QAbstractTableModel):
+    # read-only model over pandas DataFrame: the view asks only for cells of visible rows, so large tables are shown at once.
+    # The model keeps a shallow copy of the table (data is shared, not copied), so columns added to the original later do not affect it
+
+    def __init__(self, table=None):
+        super().__init__()
+        self.table = pd.DataFrame()
+        self.columns = []
+        if table is not None:
+            self.setTable(table)
+
+    def setTable(self, table):
+        self.beginResetModel()
+        self.table = table.copy(deep=False)
+        self.columns = [self.table.iloc[:, j].values for j in range(len(self.table.columns))]
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.table)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        return str(self.columns[index.column()][index.row()])
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return str(self.table.columns[section])
+        return str(section + 1)
+
+
+class Task(QtCore.QThread):
+    # runs func(*args) in background thread and sends its result (False if it fails with exception) by done signal
+
+    done = QtCore.pyqtSignal(object)
+
+    def __init__(self, func, *args):
+        super().__init__()
+        self.func = func
+        self.args = args
+
+    def run(self):
+        try:
+            result = self.func(*self.args)
+        except Exception as e:
+            print(f'Error: {e}')
+            result = False
+        self.done.emit(result)
+
+
 class ExtractorApp(QtWidgets.QMainWindow, design.Ui_MainWindow):
 
+    # extractor events and finished files come from background thread, signals pass them to GUI thread
+    extractorEvent = QtCore.pyqtSignal(object)
+    fileDone = QtCore.pyqtSignal(int, str)
+
     geo_c = []
     grid_c = []
     depth = []
@@ -34,6 +92,16 @@ class ExtractorApp(QtWidgets.QMainWindow, design.Ui_MainWindow):
         self.setupUi(self)  
 
         self.extractor = Extractor(True)
+        self.extractor.listeners.append(self.extractorEvent.emit)
+        self.well_model = DataFrameModel()
+        self.table_WellData.setModel(self.well_model)
+        self.extractorEvent.connect(self.onExtractorEvent)
+        self.fileDone.connect(self.updateProgress)
+        self.task = None
+        self.result_filename = ""
+        self.progress_start = 0
+        self.file_fractions = {}
+        self.file_traces = {}
         
         self.button_OpenSegyFolder.clicked.connect(self.chooseSegyFolder)
         self.button_ScanSegyFolder.clicked.connect(self.scanSegyFolder)
@@ -42,7 +110,9 @@ class ExtractorApp(QtWidgets.QMainWindow, design.Ui_MainWindow):
         self.button_ScanWellFile.clicked.connect(self.scanWellFile)
 
         self.button_Extract.clicked.connect(self.extractData)
+        self.button_Cancel.clicked.connect(self.cancelExtraction)
         self.checkbox_bin_averaging.toggled.connect(self.enableExpansion)
+        self.spinbox_workers.valueChanged.connect(self.enablePrefetch)
         
         #self.spinbox_expansion.valueChanged.connect(self.ceilExpansionValue)
 
@@ -52,12 +122,26 @@ class ExtractorApp(QtWidgets.QMainWindow, design.Ui_MainWindow):
     def wait_start(self):
         self.group_Seismic.setProperty("enabled", False)
         self.group_Wells.setProperty("enabled", False)   
-        QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
+        self.button_Extract.setProperty("enabled", False)
+        QtWidgets.qApp.setOverrideCursor(QtCore.Qt.BusyCursor)
 
     def wait_end(self):  
         QtWidgets.qApp.setOverrideCursor(QtCore.Qt.ArrowCursor)    
         self.group_Seismic.setProperty("enabled", True)
         self.group_Wells.setProperty("enabled", True)   
+        self.button_Extract.setProperty("enabled", True)
+
+    def runTask(self, finished, func, *args):
+        # runs func(*args) in background thread, finished(result) is called in GUI thread when it is done
+        self.task = Task(func, *args)
+        self.task.done.connect(finished)
+        self.task.start()
+
+    def closeEvent(self, event):
+        if self.task is not None and self.task.isRunning():
+            self.extractor.cancel()
+            self.task.wait()
+        event.accept()
         
     def errorMessage(self, text):
         msg = QtWidgets.QMessageBox()
@@ -89,15 +173,21 @@ class ExtractorApp(QtWidgets.QMainWindow, design.Ui_MainWindow):
 
     def scanSegyFolder(self):        
         self.list_Filenames.clear()                
-        self.wait_start()
         directory = self.edit_SEGYFolderName.text()
-        if directory:                    
-            if not self.extractor.scan_seismic_folder(directory):
-                self.errorMessage('Check your SEG-Y folder!')
-                return          
-            self.fill_segyparams_table()                   
+        if not directory:
+            return
+        self.wait_start()
+        self.statusbar.showMessage(f'Scanning {directory}...')
+        self.runTask(self.segyFolderScanned, self.extractor.scan_seismic_folder, directory)
+
+    def segyFolderScanned(self, ok):
+        self.wait_end()
+        if not ok:
+            self.errorMessage('Check your SEG-Y folder!')
+            return          
+        self.fill_segyparams_table()                   
+        self.statusbar.showMessage(f'{len(self.extractor.grid_coords)} trace headers scanned, {self.extractor.scan_rate:.0f} traces/s')
         self.list_Filenames.addItems(self.extractor.filenames)    
-        self.wait_end()   
         target_item = self.table_SEGYParams.item(5, 1)
         self.spinbox_expansion.setValue(0)
         self.spinbox_expansion.setSingleStep(int(self.extractor.bin_size))
@@ -121,17 +211,17 @@ class ExtractorApp(QtWidgets.QMainWindow, design.Ui_MainWindow):
             self.edit_WellFileName.setText(filename)               
 
     def fill_wellTable(self):    
-        self.table_WellData.setRowCount(len(self.extractor.table))
-        self.table_WellData.setColumnCount(len(self.extractor.table.columns))
-        self.table_WellData.setHorizontalHeaderLabels(self.extractor.table.columns)
-        for i in range(len(self.extractor.table)):
-            for j in range(len(self.extractor.table.columns)):
-                self.table_WellData.setItem(i, j, design.create_non_editable_item(str(self.extractor.table.iloc[i, j])))                      
+        # loaded table (or extraction results) is shown without copying
+        self.well_model.setTable(self.extractor.table)
 
     def scanWellFile(self):          
         print(self.edit_WellFileName.text())
         self.wait_start()
-        if not self.extractor.load_table(self.edit_WellFileName.text()):    
+        self.runTask(self.wellFileScanned, self.extractor.load_table, self.edit_WellFileName.text())
+
+    def wellFileScanned(self, ok):
+        if not ok:
+            self.wait_end()
             self.errorMessage("Something wrong with your well coordinates table!")   
             return
         
@@ -172,6 +262,7 @@ class ExtractorApp(QtWidgets.QMainWindow, design.Ui_MainWindow):
             return      
 
         self.extractor.recalc_depth(depth_start)    
+        self.extractor.sparse = self.checkbox_sparse.isChecked()
        
 
         if not self.extractor.set_columns_by_name(self.combo_choose_wellcol.currentText(), 
@@ -183,40 +274,121 @@ class ExtractorApp(QtWidgets.QMainWindow, design.Ui_MainWindow):
         if expansion >= np.max(self.extractor.inlines) or expansion >= np.max(self.extractor.xlines):
             self.errorMessage("Too large expansion!")
             return 
-        
-        if not self.extractor.calc_well_grid_coords(self.checkbox_bin_averaging.isChecked(), expansion):
-            self.errorMessage("Cannot perform regression to calculate well grid coordinates!")
-            return 
 
-        filename, _ = QtWidgets.QFileDialog.getSaveFileName(None, "Save File", ".", "CSV files (*.csv);; Excel files (*.xlsx)")
+        filename, _ = QtWidgets.QFileDialog.getSaveFileName(None, "Save File", ".", 
+            "CSV files (*.csv);; Excel files (*.xlsx);; Parquet files (*.parquet);; Feather files (*.feather);; NumPy files (*.npz *.npy)")
 
         if filename:
-            for i, fname in enumerate(self.extractor.filenames):
-                
-                self.button_Extract.setProperty("visible", False)
-                self.progressBar.setProperty("visible", True)
-                self.wait_start()                    
-                
-                if not self.extractor.extract_attribute(fname):
-                    self.errorMessage(f"Cannot process file {fname}!")
-                    self.wait_end()
-                    return                         
-               
-                progval = self.progressBar.value() + 100/len(self.extractor.filenames)
-                if i == len(self.extractor.filenames)-1:
-                    progval = 100
-                self.progressBar.setProperty("value", progval)
-
-            if not self.extractor.save_result_table(filename):
-                self.errorMessage(f"Cannot save file {filename}!")
-                self.wait_end()
-                return                     
-
-            self.progressBar.setProperty("visible", False)
-            self.button_Extract.setProperty("visible", True)
-            self.wait_end()
-            self.successMessage(f'File {filename} successfully saved') 
-            self.extractor.restore_table()
+            self.button_Extract.setProperty("visible", False)
+            self.progressBar.setProperty("value", 0)
+            self.progressBar.setProperty("visible", True)
+            self.button_Cancel.setProperty("enabled", True)
+            self.button_Cancel.setProperty("visible", True)
+            self.wait_start()                    
+            self.progress_start = time.time()
+            self.file_fractions = {}
+            self.file_traces = {}
+            self.result_filename = filename
+            self.extractor.parts_folder = filename + '.parts'
+            # I/O and interpolation times are collected by pipelined reading only
+            self.extractor.io_time = self.extractor.compute_time = 0
+            self.extractor.cancel_event.clear() # Cancel of previous extraction must not stop this one before it starts
+            self.statusbar.showMessage('Calculating well grid coordinates...')
+            self.runTask(self.extractionFinished, self.extractAndSave, self.checkbox_bin_averaging.isChecked(), expansion, 
+                         self.spinbox_workers.value(), self.spinbox_prefetch.value(), filename)
+
+    def extractAndSave(self, bin_averaging, expansion, workers, prefetch, filename):
+        # runs in background thread, returns error message, empty string on success or None if cancelled. 
+        # Well grid coordinates are calculated here too, as they take long for large tables.
+        # Result file is written only if all files are extracted
+        if not self.extractor.calc_well_grid_coords(bin_averaging, expansion):
+            return "Cannot perform regression to calculate well grid coordinates!"
+        if self.extractor.cancel_event.is_set():
+            # cancelled while coordinates were calculated, extraction would clear the event
+            return None
+        if not self.extractor.extract_all_attributes(workers, self.fileDone.emit, prefetch):
+            if self.extractor.cancel_event.is_set():
+                return None
+            return "Cannot extract seismic data!"
+        if not self.extractor.save_result_table(filename):
+            return f"Cannot save file {filename}!"
+        return ''
+
+    def extractionFinished(self, error):
+        self.progressBar.setProperty("visible", False)
+        self.button_Cancel.setProperty("visible", False)
+        self.button_Extract.setProperty("visible", True)
+        self.wait_end()
+        if error == '':
+            self.fill_wellTable() # results stay in view until the next scan
+        if error is None or error == '':
+            self.extractor.remove_parts() # kept after errors, so that the next run continues from them
+        self.extractor.restore_table()
+        if error is None:
+            self.statusbar.showMessage('Extraction is cancelled, nothing is saved')
+        elif error is False or error:
+            self.errorMessage(error or "Cannot extract seismic data!")
+        else:
+            msg = f'File {self.result_filename} successfully saved'
+            if self.extractor.io_time + self.extractor.compute_time > 0:
+                msg += f'\nI/O {self.extractor.io_time:.2f} s, interpolation {self.extractor.compute_time:.2f} s'
+                self.statusbar.showMessage(msg.replace('\n', ', '))
+            self.successMessage(msg) 
+
+    def cancelExtraction(self):
+        self.extractor.cancel()
+        self.button_Cancel.setProperty("enabled", False)
+        self.statusbar.showMessage('Cancelling...')
+
+    def updateProgress(self, i, fname):
+        self.file_fractions[fname] = 1
+        self.showProgress()
+
+    def showProgress(self):
+        # progress bar from finished files and fractions of files being read, throughput and ETA in status bar
+        n_files = len(self.extractor.filenames)
+        fraction = sum(self.file_fractions.values())/max(n_files, 1)
+        self.progressBar.setProperty("value", int(100*fraction))
+        elapsed = time.time() - self.progress_start
+        msg = f'{sum(f == 1 for f in self.file_fractions.values())}/{n_files} files'
+        if elapsed > 0:
+            msg += f', {sum(self.file_traces.values())/elapsed:.0f} traces/s'
+        if fraction > 0:
+            msg += f', ETA {elapsed*(1 - fraction)/fraction:.0f} s'
+        self.statusbar.showMessage(msg)
+
+    def onExtractorEvent(self, event):
+        if event['event'] == 'stage':
+            # traces of a file are counted by the stage reading it: extract_attribute, or read_attribute of prefetch reader thread
+            if event['stage'] in ('read_attribute', 'extract_attribute') and event['file']:
+                fname = os.path.basename(event['file'])
+                self.file_traces[fname] = max(self.file_traces.get(fname, 0), event['traces_read'])
+            self.showStage(event)
+        elif event['event'] == 'progress':
+            # progress inside a file, with slabs or trace chunks
+            fname = os.path.basename(event['file'])
+            self.file_fractions[fname] = max(self.file_fractions.get(fname, 0), 0.99*event['done']/max(event['total'], 1))
+            if event['unit'] == 'traces':
+                self.file_traces[fname] = max(self.file_traces.get(fname, 0), event['done'])
+            self.showProgress()
+
+    def showStage(self, event):
+        # timing of finished top-level stages (and files) of extractor in status bar
+        if event['parent'] is not None:
+            return
+        msg = f"{event['stage']} {os.path.basename(event['file'] or '')}: {event['wall_time']:.2f} s"
+        if event['bytes_read'] > 0:
+            msg += f", {event['bytes_read']/2**20:.1f} MB read"
+        if event['points'] > 0:
+            msg += f", {event['points']} points"
+        if event['peak_rss_mb'] is not None:
+            msg += f", peak memory {event['peak_rss_mb']:.0f} MB"
+        self.statusbar.showMessage(msg)
+
+    def enablePrefetch(self, workers):
+        # read-ahead works with one worker only
+        self.spinbox_prefetch.setEnabled(workers == 1)
+        self.label_prefetch.setEnabled(workers == 1)
 
     def enableExpansion(self):
         if self.spinbox_expansion.isEnabled():